@@ -0,0 +1,39 @@
+"""create teacher_genders table
+
+Revision ID: 3b7e91c2d4a5
+Revises: f4d6213a8da0
+Create Date: 2026-10-19 10:12:31.418205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e91c2d4a5'
+down_revision: Union[str, Sequence[str], None] = 'f4d6213a8da0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('teacher_genders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('gender', sa.String(), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_teacher_genders_id'), 'teacher_genders', ['id'], unique=False)
+    op.create_index(op.f('ix_teacher_genders_name'), 'teacher_genders', ['name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_teacher_genders_name'), table_name='teacher_genders')
+    op.drop_index(op.f('ix_teacher_genders_id'), table_name='teacher_genders')
+    op.drop_table('teacher_genders')
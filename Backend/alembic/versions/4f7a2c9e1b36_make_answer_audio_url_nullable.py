@@ -0,0 +1,30 @@
+"""make answer_audio_url nullable
+
+Revision ID: 4f7a2c9e1b36
+Revises: c3f19a6d5e08
+Create Date: 2026-10-19 19:41:08.203517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f7a2c9e1b36'
+down_revision: Union[str, Sequence[str], None] = 'c3f19a6d5e08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ответ сохраняется и тогда, когда архивировать аудио в S3 не удалось
+    op.alter_column('exam_answers', 'answer_audio_url', existing_type=sa.String(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("UPDATE exam_answers SET answer_audio_url = '' WHERE answer_audio_url IS NULL"))
+    op.alter_column('exam_answers', 'answer_audio_url', existing_type=sa.String(), nullable=False)
@@ -0,0 +1,35 @@
+"""drop stale legacy refresh tokens
+
+Revision ID: 5e8b3d7a9c12
+Revises: d15a0c6e2f34
+Create Date: 2026-10-19 15:02:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b3d7a9c12'
+down_revision: Union[str, Sequence[str], None] = 'd15a0c6e2f34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Refresh-токены теперь хранятся как HMAC-SHA256 дайджест. Действующие строки со
+    # старым bcrypt-хэшем переписываются при первом использовании (до REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL),
+    # а отозванные и истекшие уже никогда не совпадут - удаляем их сразу.
+    op.execute(sa.text(
+        "DELETE FROM refresh_tokens "
+        "WHERE token_hash LIKE '$2%' AND (is_revoked = true OR expires_at < now())"
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Удаленные строки не восстанавливаются; дайджесты остаются валидными строками
+    pass
@@ -0,0 +1,30 @@
+"""add history_summary to sessions
+
+Revision ID: 8c2f5a1e7b90
+Revises: 3b7e91c2d4a5
+Create Date: 2026-10-19 12:03:47.552910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f5a1e7b90'
+down_revision: Union[str, Sequence[str], None] = '3b7e91c2d4a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('exam_sessions', sa.Column('history_summary', sa.Text(), nullable=True))
+    op.add_column('study_sessions', sa.Column('history_summary', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('study_sessions', 'history_summary')
+    op.drop_column('exam_sessions', 'history_summary')
@@ -0,0 +1,40 @@
+"""add foreign key indexes
+
+Revision ID: a7c4e2b9d831
+Revises: 5e8b3d7a9c12
+Create Date: 2026-10-19 15:40:12.903417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c4e2b9d831'
+down_revision: Union[str, Sequence[str], None] = '5e8b3d7a9c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_exam_questions_exam_session_id_question_index', 'exam_questions',
+                    ['exam_session_id', 'question_index'], unique=False)
+    op.create_index('ix_study_messages_study_session_id_created_at', 'study_messages',
+                    ['study_session_id', 'created_at'], unique=False)
+    op.create_index(op.f('ix_exam_answers_question_id'), 'exam_answers', ['question_id'], unique=False)
+    op.create_index(op.f('ix_exam_sessions_student_id'), 'exam_sessions', ['student_id'], unique=False)
+    op.create_index(op.f('ix_study_sessions_student_id'), 'study_sessions', ['student_id'], unique=False)
+    op.create_index(op.f('ix_refresh_tokens_user_id'), 'refresh_tokens', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_refresh_tokens_user_id'), table_name='refresh_tokens')
+    op.drop_index(op.f('ix_study_sessions_student_id'), table_name='study_sessions')
+    op.drop_index(op.f('ix_exam_sessions_student_id'), table_name='exam_sessions')
+    op.drop_index(op.f('ix_exam_answers_question_id'), table_name='exam_answers')
+    op.drop_index('ix_study_messages_study_session_id_created_at', table_name='study_messages')
+    op.drop_index('ix_exam_questions_exam_session_id_question_index', table_name='exam_questions')
@@ -0,0 +1,61 @@
+"""create conversation_turns table
+
+Revision ID: c3f19a6d5e08
+Revises: a7c4e2b9d831
+Create Date: 2026-10-19 16:18:55.270913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f19a6d5e08'
+down_revision: Union[str, Sequence[str], None] = 'a7c4e2b9d831'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('conversation_turns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('exam_session_id', sa.Integer(), nullable=True),
+    sa.Column('study_session_id', sa.Integer(), nullable=True),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['exam_session_id'], ['exam_sessions.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['study_session_id'], ['study_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_conversation_turns_id'), 'conversation_turns', ['id'], unique=False)
+    op.create_index('ix_conversation_turns_exam_session_id_id', 'conversation_turns',
+                    ['exam_session_id', 'id'], unique=False)
+    op.create_index('ix_conversation_turns_study_session_id_id', 'conversation_turns',
+                    ['study_session_id', 'id'], unique=False)
+    op.add_column('exam_sessions', sa.Column('summarized_turn_id', sa.Integer(), nullable=True))
+    op.add_column('study_sessions', sa.Column('summarized_turn_id', sa.Integer(), nullable=True))
+
+    # Переносим накопленную историю из JSON в журнал, сохраняя порядок реплик
+    for table, column in (('exam_sessions', 'exam_session_id'), ('study_sessions', 'study_session_id')):
+        op.execute(sa.text(
+            f"INSERT INTO conversation_turns ({column}, role, content, created_at) "
+            f"SELECT s.id, m.value->>'role', COALESCE(m.value->>'content', ''), s.created_at "
+            f"FROM {table} s CROSS JOIN LATERAL json_array_elements("
+            f"CASE WHEN json_typeof(s.context_history) = 'array' THEN s.context_history ELSE '[]'::json END"
+            f") WITH ORDINALITY AS m(value, position) "
+            f"ORDER BY s.id, m.position"
+        ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('study_sessions', 'summarized_turn_id')
+    op.drop_column('exam_sessions', 'summarized_turn_id')
+    op.drop_index('ix_conversation_turns_study_session_id_id', table_name='conversation_turns')
+    op.drop_index('ix_conversation_turns_exam_session_id_id', table_name='conversation_turns')
+    op.drop_index(op.f('ix_conversation_turns_id'), table_name='conversation_turns')
+    op.drop_table('conversation_turns')
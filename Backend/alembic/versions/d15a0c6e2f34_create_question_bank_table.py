@@ -0,0 +1,45 @@
+"""create question_bank table
+
+Revision ID: d15a0c6e2f34
+Revises: 8c2f5a1e7b90
+Create Date: 2026-10-19 13:26:09.184377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd15a0c6e2f34'
+down_revision: Union[str, Sequence[str], None] = '8c2f5a1e7b90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('question_bank',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('question_text', sa.Text(), nullable=False),
+    sa.Column('difficulty', sa.String(), nullable=False),
+    sa.Column('source_chunk_ids', sa.JSON(), nullable=True),
+    sa.Column('times_used', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_question_bank_id'), 'question_bank', ['id'], unique=False)
+    op.create_index(op.f('ix_question_bank_subject'), 'question_bank', ['subject'], unique=False)
+    op.add_column('exam_questions', sa.Column('bank_question_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('exam_questions_bank_question_id_fkey', 'exam_questions', 'question_bank', ['bank_question_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('exam_questions_bank_question_id_fkey', 'exam_questions', type_='foreignkey')
+    op.drop_column('exam_questions', 'bank_question_id')
+    op.drop_index(op.f('ix_question_bank_subject'), table_name='question_bank')
+    op.drop_index(op.f('ix_question_bank_id'), table_name='question_bank')
+    op.drop_table('question_bank')
@@ -1,19 +1,58 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import hmac
 import secrets
+import time
 from sqlalchemy import select
 from auth.models import User, RefreshToken
 from auth.database import AsyncSessionLocal
 from main.config import Settings
+from main.metrics import metrics
 
 
-def verify_password(plain_password, hashed_password):
-    return Settings.pwd_context.verify(plain_password, hashed_password)
+# bcrypt занимает ~200-300 мс CPU и отпускает GIL - выполняем его в отдельном
+# ограниченном пуле, чтобы всплеск логинов не останавливал event loop и не
+# занимал общий пул потоков (S3, парсинг PDF)
+_hashing_executor = ThreadPoolExecutor(
+    max_workers=Settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hashing_pending = 0
 
 
-def get_password_hash(password):
-    return Settings.pwd_context.hash(password)
+async def _run_hashing(operation: str, fn, *args):
+    global _hashing_pending
+    queued = time.monotonic()
+
+    def timed():
+        started = time.monotonic()
+        metrics.observe("password_hash_queue_wait_seconds", started - queued, operation=operation)
+        try:
+            return fn(*args)
+        finally:
+            metrics.observe("password_hash_seconds", time.monotonic() - started, operation=operation)
+
+    _hashing_pending += 1
+    metrics.set_gauge("password_hash_queue_depth", _hashing_pending)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hashing_executor, timed)
+    finally:
+        _hashing_pending -= 1
+        metrics.set_gauge("password_hash_queue_depth", _hashing_pending)
+
+
+def shutdown_hashing_pool():
+    _hashing_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def verify_password(plain_password, hashed_password):
+    return await _run_hashing("verify", Settings.pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password):
+    return await _run_hashing("hash", Settings.pwd_context.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -37,13 +76,29 @@ async def get_user_by_name(db: AsyncSessionLocal, username: str):
 
 async def authenticate_user(db, email: str, password: str):
     user = await get_user_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password(password, user.hashed_password):
         return False
     return user
 
 
+# Префикс старых bcrypt-хэшей refresh-токенов
+LEGACY_TOKEN_HASH_PREFIX = "$2"
+
+
+def hash_refresh_token(raw_token: str) -> str:
+    """
+    Детерминированный дайджест refresh-токена (HMAC-SHA256). Токен - 256 бит
+    случайности, поэтому медленный bcrypt не нужен, а дайджест можно искать по индексу.
+    """
+    return hmac.new(
+        Settings.REFRESH_TOKEN_PEPPER.encode("utf-8"),
+        raw_token.encode("utf-8"),
+        hashlib.sha256
+    ).hexdigest()
+
+
 async def save_refresh_token(db, user_id: int, raw_token: str, expires_delta: timedelta):
-    hashed_token = Settings.pwd_context.hash(raw_token)
+    hashed_token = hash_refresh_token(raw_token)
     expires_at = datetime.now() + expires_delta
     new_refresh = RefreshToken(
         token_hash=hashed_token, user_id=user_id, expires_at=expires_at)
@@ -52,10 +107,44 @@ async def save_refresh_token(db, user_id: int, raw_token: str, expires_delta: ti
     return raw_token
 
 
+# Сбрасывается, когда действующих строк со старым хэшем не осталось: новые не появляются
+_legacy_tokens_remaining = True
+
+
+def legacy_fallback_enabled() -> bool:
+    """Поиск по старым bcrypt-хэшам разрешен только до REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL"""
+    until = Settings.REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL
+    return _legacy_tokens_remaining and until is not None and datetime.now() < until
+
+
 async def get_refresh_token(db, raw_token: str):
-    result = await db.execute(select(RefreshToken).where(RefreshToken.is_revoked == False))
-    for token_record in result.scalars():
-        if Settings.pwd_context.verify(raw_token, token_record.token_hash):
+    hashed_token = hash_refresh_token(raw_token)
+    result = await db.execute(select(RefreshToken).where(RefreshToken.token_hash == hashed_token))
+    token_record = result.scalar_one_or_none()
+    if token_record is None and legacy_fallback_enabled():
+        token_record = await _get_legacy_refresh_token(db, raw_token, hashed_token)
+    return token_record
+
+
+async def _get_legacy_refresh_token(db, raw_token: str, hashed_token: str):
+    """
+    Ищет токен среди действующих строк со старым bcrypt-хэшем и при совпадении
+    переписывает хэш на дайджест, чтобы следующий поиск шел по индексу
+    """
+    global _legacy_tokens_remaining
+    result = await db.execute(select(RefreshToken).where(
+        RefreshToken.token_hash.startswith(LEGACY_TOKEN_HASH_PREFIX),
+        RefreshToken.is_revoked == False,
+        RefreshToken.expires_at > datetime.now()
+    ))
+    legacy_tokens = result.scalars().all()
+    if not legacy_tokens:
+        _legacy_tokens_remaining = False
+        return None
+    for token_record in legacy_tokens:
+        if await verify_password(raw_token, token_record.token_hash):
+            token_record.token_hash = hashed_token
+            await db.commit()
             return token_record
     return None
 
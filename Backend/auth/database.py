@@ -1,11 +1,190 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
-from sqlalchemy import MetaData
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy import MetaData, event
+from main.cache import LRUCache
 from main.config import Settings
+from main.metrics import metrics
 
-engine = create_async_engine(Settings.DATABASE_URL, echo=True)
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений с замерами: db_pool_acquire_seconds - полное время получения
+    соединения из пула (ожидание свободного и, если пул растет, открытие нового),
+    db_pool_connect_seconds - только открытие новых соединений
+    """
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("db_pool_acquire_seconds", time.monotonic() - started,
+                            pool=self.logging_name or "primary")
+
+    def _create_connection(self):
+        started = time.monotonic()
+        try:
+            return super()._create_connection()
+        finally:
+            metrics.observe("db_pool_connect_seconds", time.monotonic() - started,
+                            pool=self.logging_name or "primary")
+
+
+def _instrument_pool(engine: AsyncEngine, name: str):
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return
+    capacity = pool.size() + Settings.DB_MAX_OVERFLOW
+
+    def report(checked_out: int):
+        metrics.set_gauge("db_pool_checked_out", checked_out, pool=name)
+        metrics.set_gauge("db_pool_saturation", checked_out / capacity if capacity else 0.0, pool=name)
+
+    def on_checkout(*_):
+        report(pool.checkedout())
+
+    def on_checkin(*_):
+        # Событие checkin срабатывает до возврата соединения в очередь пула
+        report(max(pool.checkedout() - 1, 0))
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+
+
+def create_engine_from_settings(url: str, name: str = "primary") -> AsyncEngine:
+    """
+    Создает движок БД по профилю из настроек: размер пула, pre-ping, recycle,
+    кэш подготовленных выражений asyncpg и режим совместимости с PgBouncer
+
+    Args:
+        url: DSN базы данных
+        name: Имя пула (метка метрик)
+
+    Returns:
+        AsyncEngine: Движок
+    """
+    connect_args = {}
+    if Settings.DB_PGBOUNCER:
+        # PgBouncer в режиме transaction pooling: подготовленные выражения не
+        # переживают смену серверного соединения - отключаем кэши и даем
+        # выражениям уникальные имена; пулом соединений управляет PgBouncer
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        })
+        return create_async_engine(
+            url,
+            echo=Settings.DB_ECHO,
+            poolclass=NullPool,
+            connect_args=connect_args
+        )
+
+    connect_args.update({
+        "statement_cache_size": Settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": Settings.DB_STATEMENT_CACHE_SIZE,
+    })
+    engine = create_async_engine(
+        url,
+        echo=Settings.DB_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=Settings.DB_POOL_SIZE,
+        max_overflow=Settings.DB_MAX_OVERFLOW,
+        pool_timeout=Settings.DB_POOL_TIMEOUT,
+        pool_recycle=Settings.DB_POOL_RECYCLE,
+        pool_pre_ping=Settings.DB_POOL_PRE_PING,
+        pool_logging_name=name,
+        connect_args=connect_args
+    )
+    _instrument_pool(engine, name)
+    return engine
+
+
+engine = create_engine_from_settings(Settings.DATABASE_URL)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Реплика для read-only запросов (если не задана - все идет в основную БД)
+replica_engine = create_engine_from_settings(
+    Settings.DATABASE_REPLICA_URL, "replica") if Settings.DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = sessionmaker(
+    replica_engine, class_=AsyncSession, expire_on_commit=False) if replica_engine is not None else None
+
+# Клиенты, недавно писавшие в основную БД: их чтения идут туда же, пока реплика
+# может отставать (read-your-writes). Ключ - subject токена (email).
+recent_writes = LRUCache(maxsize=100000, ttl=Settings.READ_YOUR_WRITES_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_write(session):
+    key = session.info.get("read_your_writes_key")
+    if session.info.pop("wrote", False) and key:
+        recent_writes.set(key, True)
+
+
+async def end_read_transaction(db: AsyncSession):
+    """
+    Завершает открытую (read-only) транзакцию, чтобы соединение вернулось в пул
+    и не простаивало "idle in transaction" во время внешних вызовов (LLM, TTS)
+    """
+    if db.in_transaction():
+        await db.commit()
+
+
+def read_session_factory(client_key: Optional[str] = None):
+    """
+    Выбирает фабрику сессий для read-only запроса: реплика, если она настроена
+    и клиент не писал в основную БД последние READ_YOUR_WRITES_SECONDS секунд
+    """
+    if ReplicaSessionLocal is None:
+        return AsyncSessionLocal
+    if client_key and recent_writes.get(client_key):
+        metrics.inc("db_read_routing_total", target="primary", reason="recent_write")
+        return AsyncSessionLocal
+    metrics.inc("db_read_routing_total", target="replica", reason="read_only")
+    return ReplicaSessionLocal
+
+
+class StatementCounter:
+    """Счетчик SQL-запросов (round-trip к БД) в рамках одной задачи"""
+
+    def __init__(self):
+        self.count = 0
+
+
+_statement_counter: ContextVar[Optional[StatementCounter]] = ContextVar("statement_counter", default=None)
+
+
+def count_statements() -> StatementCounter:
+    """Начинает подсчет SQL-запросов текущей задачи (запроса)"""
+    counter = StatementCounter()
+    _statement_counter.set(counter)
+    return counter
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _statement_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+@event.listens_for(engine.sync_engine, "commit")
+def _count_commit(conn):
+    counter = _statement_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -1,29 +1,101 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
-from auth.database import AsyncSessionLocal
+from auth.database import AsyncSessionLocal, read_session_factory
 from auth.auth import get_user_by_name, get_user_by_email
+from auth.models import User
+from main.cache import LRUCache
 from main.config import Settings
+from main.metrics import metrics
 
 
-async def get_db():
+# Кэш аутентифицированных пользователей по subject токена (email)
+user_cache = LRUCache(maxsize=Settings.USER_CACHE_SIZE, ttl=Settings.USER_CACHE_TTL)
+
+
+def _snapshot_user(user: User) -> User:
+    # В кэше хранится копия, не привязанная к сессии БД запроса
+    return User(
+        id=user.id,
+        email=user.email,
+        username=user.username,
+        hashed_password=user.hashed_password,
+        is_active=user.is_active,
+        created_at=user.created_at,
+        subscription_level=user.subscription_level,
+        video_urls=user.video_urls
+    )
+
+
+def invalidate_cached_user(email: str):
+    """Сбрасывает кэш пользователя (после изменения профиля или подписки)"""
+    user_cache.pop(email)
+
+
+def token_subject(token: str) -> Optional[str]:
+    """Subject токена (email) или None, если токен недействителен"""
+    try:
+        payload = jwt.decode(token, Settings.SECRET_KEY, algorithms=[Settings.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("email")
+
+
+def client_key(connection: HTTPConnection) -> Optional[str]:
+    """
+    Ключ клиента для read-your-writes - subject токена (email). Токен берется из
+    заголовка "Authorization: Bearer" (HTTP) или query-параметра token (WebSocket),
+    поэтому у пользователя один ключ независимо от транспорта.
+    """
+    scheme, _, token = (connection.headers.get("authorization") or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = connection.query_params.get("token")
+    if not token:
+        return None
+    return token_subject(token)
+
+
+def remember_writer(db: AsyncSession, email: str):
+    """Привязывает запись к пользователю, если в запросе еще нет его токена (/register, /login)"""
+    db.sync_session.info["read_your_writes_key"] = email
+
+
+async def get_db(connection: HTTPConnection):
     async with AsyncSessionLocal() as session:
+        session.sync_session.info["read_your_writes_key"] = client_key(connection)
         yield session
 
-async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(Settings.oauth2_scheme)):
+
+async def get_read_db(connection: HTTPConnection):
+    """Сессия для read-only эндпоинтов: реплика с откатом на основную БД после записи"""
+    async with read_session_factory(client_key(connection))() as session:
+        yield session
+
+async def get_user_from_token(db: AsyncSession, token: str):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, Settings.SECRET_KEY, algorithms=[Settings.ALGORITHM])
-        email: str = payload.get("email")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    email = token_subject(token)
+    if email is None:
         raise credentials_exception
+
+    cached_user = user_cache.get(email)
+    if cached_user is not None:
+        metrics.inc("user_cache_total", result="hit")
+        return cached_user
+
+    metrics.inc("user_cache_total", result="miss")
     user = await get_user_by_email(db, email)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    user_cache.set(email, _snapshot_user(user))
+    return user
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(Settings.oauth2_scheme)):
+    # Пользователь читается из основной БД: иначе отстающая реплика вернет в
+    # user_cache данные, только что сброшенные invalidate_cached_user
+    return await get_user_from_token(db, token)
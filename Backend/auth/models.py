@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, Text, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON, Text, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from auth.database import Base
@@ -13,7 +13,7 @@ class User(Base):
     username = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     subscription_level = Column(String, default="free", nullable=False)
     video_urls = Column(JSON, default=list)
@@ -31,7 +31,7 @@ class RefreshToken(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     token_hash = Column(String, unique=True, index=True, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_revoked = Column(Boolean, default=False)
@@ -45,26 +45,58 @@ class SubjectMaterials(Base):
     id = Column(Integer, primary_key=True, index=True)
     subject = Column(String, nullable=False, index=True)
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class TeacherGender(Base):
+    __tablename__ = "teacher_genders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Нормализованное имя преподавателя (нижний регистр, одиночные пробелы)
+    name = Column(String, unique=True, index=True, nullable=False)
+    # male, female
+    gender = Column(String, nullable=False)
+    # llm, manual
+    source = Column(String, default="llm", nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class QuestionBankItem(Base):
+    __tablename__ = "question_bank"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String, nullable=False, index=True)
+    question_text = Column(Text, nullable=False)
+    # easy, medium, hard
+    difficulty = Column(String, default="medium", nullable=False)
+    # ID чанков в Qdrant, по которым сгенерирован вопрос
+    source_chunk_ids = Column(JSON, default=list)
+    times_used = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
 
 
 class ExamSession(Base):
     __tablename__ = "exam_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     teacher_name = Column(String, nullable=False)
     subject = Column(String, nullable=False)
     teacher_description = Column(Text, nullable=False)
     # male, female
     teacher_gender = Column(String, default="male", nullable=False)
-    # in_progress, completed, failed
+    # in_progress, completed, failed, abandoned
     status = Column(String, default="in_progress", nullable=False)
     # neutral, happy, disappointed, angry
     teacher_mood = Column(String, default="neutral", nullable=False)
-    context_history = Column(JSON, default=list)  # История диалога для OpenAI
+    # Устарело: история хранится построчно в conversation_turns
+    context_history = Column(JSON, default=list)
+    # Краткое содержание свернутых старых ходов диалога
+    history_summary = Column(Text, nullable=True)
+    # Последний ход из conversation_turns, учтенный в history_summary
+    summarized_turn_id = Column(Integer, nullable=True)
     current_question_index = Column(Integer, default=0, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     completed_at = Column(DateTime, nullable=True)
 
     student = relationship("User", back_populates="exam_sessions")
@@ -76,7 +108,7 @@ class StudySession(Base):
     __tablename__ = "study_sessions"
 
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     teacher_name = Column(String, nullable=False)
     subject = Column(String, nullable=False)
     teacher_description = Column(Text, nullable=False)
@@ -84,8 +116,13 @@ class StudySession(Base):
     teacher_gender = Column(String, default="male", nullable=False)
     status = Column(String, default="active",
                     nullable=False)  # active, completed
-    context_history = Column(JSON, default=list)  # История диалога для OpenAI
-    created_at = Column(DateTime, default=datetime.now())
+    # Устарело: история хранится построчно в conversation_turns
+    context_history = Column(JSON, default=list)
+    # Краткое содержание свернутых старых ходов диалога
+    history_summary = Column(Text, nullable=True)
+    # Последний ход из conversation_turns, учтенный в history_summary
+    summarized_turn_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
     completed_at = Column(DateTime, nullable=True)
 
     student = relationship("User", back_populates="study_sessions")
@@ -95,6 +132,9 @@ class StudySession(Base):
 
 class StudyMessage(Base):
     __tablename__ = "study_messages"
+    __table_args__ = (
+        Index("ix_study_messages_study_session_id_created_at", "study_session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     study_session_id = Column(Integer, ForeignKey(
@@ -102,13 +142,35 @@ class StudyMessage(Base):
     message_text = Column(Text, nullable=False)
     # True - от студента, False - от преподавателя
     is_from_student = Column(Boolean, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     study_session = relationship("StudySession", back_populates="messages")
 
 
+class ConversationTurn(Base):
+    """Реплика диалога сессии (журнал только на добавление)"""
+    __tablename__ = "conversation_turns"
+    __table_args__ = (
+        Index("ix_conversation_turns_exam_session_id_id", "exam_session_id", "id"),
+        Index("ix_conversation_turns_study_session_id_id", "study_session_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    exam_session_id = Column(Integer, ForeignKey(
+        "exam_sessions.id", ondelete="CASCADE"), nullable=True)
+    study_session_id = Column(Integer, ForeignKey(
+        "study_sessions.id", ondelete="CASCADE"), nullable=True)
+    # system, user, assistant
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class ExamQuestion(Base):
     __tablename__ = "exam_questions"
+    __table_args__ = (
+        Index("ix_exam_questions_exam_session_id_question_index", "exam_session_id", "question_index"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     exam_session_id = Column(Integer, ForeignKey(
@@ -117,7 +179,10 @@ class ExamQuestion(Base):
     question_text = Column(Text, nullable=False)
     question_audio_url = Column(String, nullable=True)
     is_follow_up = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime, default=datetime.now())
+    # Вопрос из банка, если он не сгенерирован на лету
+    bank_question_id = Column(Integer, ForeignKey(
+        "question_bank.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
 
     exam_session = relationship("ExamSession", back_populates="questions")
     answers = relationship("ExamAnswer", back_populates="question",
@@ -129,12 +194,13 @@ class ExamAnswer(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     question_id = Column(Integer, ForeignKey(
-        "exam_questions.id"), nullable=False)
-    answer_audio_url = Column(String, nullable=False)
+        "exam_questions.id"), nullable=False, index=True)
+    # NULL, если аудио не удалось сохранить в S3
+    answer_audio_url = Column(String, nullable=True)
     transcribed_text = Column(Text, nullable=True)
     is_correct = Column(Boolean, nullable=True)
     ai_feedback = Column(Text, nullable=True)
     teacher_mood_after = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
 
     question = relationship("ExamQuestion", back_populates="answers")
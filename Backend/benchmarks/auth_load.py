@@ -0,0 +1,82 @@
+"""
+Пропускная способность /register и /login под параллельной нагрузкой (bcrypt
+выполняется в пуле PASSWORD_HASH_WORKERS). Заодно проверяет, что event loop не
+блокируется: во время нагрузки параллельно опрашивается /openapi.json.
+
+Запускается против работающего сервера с отдельной базой (создает пользователей):
+
+    cd Backend && uvicorn main.endpoints:app --port 8000
+    python -m benchmarks.auth_load --base-url http://localhost:8000 --users 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_phase(client: httpx.AsyncClient, name: str, path: str, payloads, concurrency: int):
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(payload):
+        nonlocal failures
+        async with gate:
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async def probe():
+        # Легкий запрос, не требующий bcrypt: его задержка растет, только если блокируется event loop
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get("/openapi.json")
+            probe_latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(0.05)
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe_task
+
+    print(f"{name}: {len(payloads)} requests, {failures} failed, {len(payloads) / elapsed:.1f} req/s, "
+          f"p50 {_percentile(latencies, 0.5) * 1000:.0f} ms, p95 {_percentile(latencies, 0.95) * 1000:.0f} ms, "
+          f"max {max(latencies) * 1000:.0f} ms")
+    if probe_latencies:
+        print(f"  concurrent /openapi.json: mean {statistics.mean(probe_latencies) * 1000:.1f} ms, "
+              f"max {max(probe_latencies) * 1000:.1f} ms")
+
+
+async def main(args):
+    run_id = uuid.uuid4().hex[:8]
+    users = [
+        {"email": f"load-{run_id}-{i}@example.com", "username": f"load-{run_id}-{i}", "password": "load-password"}
+        for i in range(args.users)
+    ]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120) as client:
+        await run_phase(client, "/register", "/register", users, args.concurrency)
+        await run_phase(client, "/login", "/login",
+                        [{"email": u["email"], "password": u["password"]} for u in users], args.concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
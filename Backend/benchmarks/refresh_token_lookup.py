@@ -0,0 +1,77 @@
+"""
+Стоимость /refresh для неизвестного токена в зависимости от числа действующих
+строк со старым bcrypt-хэшем: с поиском по старым хэшам и без него.
+
+Пишет в БД из DATABASE_URL (создает и затем удаляет своего пользователя и его
+токены) - запускать на отдельной базе:
+
+    cd Backend && python -m benchmarks.refresh_token_lookup --sizes 0 10 25 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete
+from auth.auth import get_refresh_token, create_refresh_token, get_password_hash, shutdown_hashing_pool
+from auth.database import AsyncSessionLocal, engine
+from auth.models import User, RefreshToken
+from main.config import Settings
+
+
+async def add_legacy_tokens(user_id: int, count: int):
+    hashes = await asyncio.gather(*(get_password_hash(create_refresh_token()) for _ in range(count)))
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            RefreshToken(token_hash=token_hash, user_id=user_id,
+                         expires_at=datetime.now() + timedelta(days=1))
+            for token_hash in hashes
+        ])
+        await db.commit()
+
+
+async def measure_lookup(repeat: int) -> float:
+    """Среднее время поиска неизвестного токена (секунды)"""
+    elapsed = 0.0
+    for _ in range(repeat):
+        async with AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await get_refresh_token(db, create_refresh_token())
+            elapsed += time.perf_counter() - started
+    return elapsed / repeat
+
+
+async def main(sizes, repeat: int):
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"bench-{uuid.uuid4().hex}@example.com", username="bench", hashed_password="x")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    try:
+        print(f"{'legacy rows':>12} {'fallback off, ms':>17} {'fallback on, ms':>16}")
+        legacy_rows = 0
+        for size in sorted(sizes):
+            await add_legacy_tokens(user_id, size - legacy_rows)
+            legacy_rows = size
+
+            Settings.REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL = None
+            off = await measure_lookup(repeat)
+            Settings.REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL = datetime.now() + timedelta(hours=1)
+            on = await measure_lookup(repeat)
+            print(f"{size:>12} {off * 1000:>17.1f} {on * 1000:>16.1f}")
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+        await engine.dispose()
+        shutdown_hashing_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 10, 25, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
@@ -0,0 +1,127 @@
+"""
+Нагрузочный тест клиента SpeechKit: поднимает на localhost фейковый сервер
+синтеза с заданной задержкой и параллельно вызывает synthesize_speech /
+synthesize_long_speech. Показывает пропускную способность, задержки, число
+TCP-соединений (переиспользование keep-alive пула) и пиковый параллелизм на
+стороне сервера (ограничение SPEECHKIT_MAX_CONCURRENCY).
+
+    cd Backend && python -m benchmarks.tts_load --requests 500 --concurrency 100 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import struct
+import time
+
+
+class FakeSpeechKit:
+    """HTTP/1.1 сервер с keep-alive, отвечающий коротким потоком OggOpus"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.audio = _fake_opus_stream()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+                self.requests += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.active -= 1
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: audio/ogg\r\n"
+                    b"Connection: keep-alive\r\n"
+                    + f"Content-Length: {len(self.audio)}\r\n\r\n".encode() + self.audio)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _fake_opus_stream() -> bytes:
+    from exam.ogg import OggPage, FLAG_BOS
+
+    opus_head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 48000, 0, 0)
+    opus_tags = b"OpusTags" + struct.pack("<I", 4) + b"fake" + struct.pack("<I", 0)
+    frame = b"\xf8\xff\xfe"
+    pages = [
+        OggPage(FLAG_BOS, 0, 1, 0, bytes([len(opus_head)]), opus_head),
+        OggPage(0, 0, 1, 1, bytes([len(opus_tags)]), opus_tags),
+        OggPage(0, 960, 1, 2, bytes([len(frame)]), frame),
+    ]
+    return b"".join(page.to_bytes() for page in pages)
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def main(args):
+    server_state = FakeSpeechKit(args.latency)
+    server = await asyncio.start_server(server_state.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    # Клиент SpeechKit читает настройки при импорте
+    os.environ["SPEECHKIT_URL"] = f"http://127.0.0.1:{port}/speech/v1/tts:synthesize"
+    from exam.speechkit import synthesize_speech, synthesize_long_speech, speechkit_client
+    from main.config import Settings
+
+    text = "Хорошо. " * (args.text_chars // 8 or 1)
+    synthesize = synthesize_long_speech if args.long else synthesize_speech
+    gate = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one():
+        async with gate:
+            started = time.perf_counter()
+            await synthesize(text.strip())
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+    finally:
+        await speechkit_client.aclose()
+        server.close()
+        await server.wait_closed()
+    elapsed = time.perf_counter() - started
+
+    print(f"calls:              {args.requests} ({'synthesize_long_speech' if args.long else 'synthesize_speech'}, "
+          f"{len(text.strip())} chars, concurrency {args.concurrency})")
+    print(f"fake server:        {args.latency * 1000:.0f} ms per request")
+    print(f"throughput:         {args.requests / elapsed:.1f} calls/s")
+    print(f"latency p50/p95:    {_percentile(latencies, 0.5) * 1000:.1f} / "
+          f"{_percentile(latencies, 0.95) * 1000:.1f} ms (mean {statistics.mean(latencies) * 1000:.1f} ms)")
+    print(f"server requests:    {server_state.requests}")
+    print(f"TCP connections:    {server_state.connections} (max {Settings.SPEECHKIT_MAX_CONNECTIONS})")
+    print(f"peak in-flight:     {server_state.max_active} (limit {Settings.SPEECHKIT_MAX_CONCURRENCY})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Задержка фейкового сервера, секунды")
+    parser.add_argument("--text-chars", type=int, default=80)
+    parser.add_argument("--long", action="store_true", help="Синтез длинного текста по частям")
+    asyncio.run(main(parser.parse_args()))
@@ -1,5 +1,218 @@
+import asyncio
 import os
-from deepgram import DeepgramClient
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional
+import httpx
+from deepgram import AsyncDeepgramClient
+from deepgram.listen.v1.types import ListenV1Results
+from main.config import Settings
+from main.metrics import metrics
+
+
+class DeepgramTranscriber:
+    """
+    Долгоживущий асинхронный клиент Deepgram: создается один раз при старте
+    приложения, переиспользует соединения, ограничивает параллелизм и
+    повторяет запросы при временных ошибках
+    """
+
+    def __init__(self, max_connections: int, max_concurrency: int, timeout: float, max_retries: int):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncDeepgramClient] = None
+
+    def start(self):
+        """Создает клиент Deepgram (вызывается при старте приложения)"""
+        if self._client is not None:
+            return
+
+        deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
+        if not deepgram_api_key:
+            raise ValueError("DEEPGRAM_API_KEY not found in environment variables")
+
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=60
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=5.0)
+        )
+        self._client = AsyncDeepgramClient(
+            api_key=deepgram_api_key,
+            httpx_client=self._http_client,
+            timeout=self.timeout
+        )
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._client = None
+
+    async def _transcribe(self, request_fn: Callable[[], Awaitable]) -> str:
+        """Выполняет запрос распознавания с ограничением параллелизма и повторами"""
+        self.start()
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                async with self.semaphore:
+                    response = await request_fn()
+                metrics.observe("stt_transcription_seconds", time.monotonic() - started)
+                return _extract_transcript(response)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Deepgram request failed, retrying: {e}")
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                if status_code is None or (status_code != 429 and status_code < 500) or attempt >= self.max_retries:
+                    raise
+                print(f"Deepgram request failed, retrying: {e}")
+            metrics.inc("stt_retries_total")
+            await asyncio.sleep(random.uniform(0, Settings.DEEPGRAM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+    async def transcribe_url(self, audio_url: str) -> str:
+        """
+        Транскрибирует аудио по URL
+
+        Args:
+            audio_url: URL аудио файла
+
+        Returns:
+            str: Транскрибированный текст
+        """
+        return await self._transcribe(lambda: self._client.listen.v1.media.transcribe_url(
+            url=audio_url,
+            model="nova-2",
+            language="ru",
+            smart_format=True,
+        ))
+
+    async def transcribe_bytes(self, audio_data: bytes) -> str:
+        """
+        Транскрибирует аудио из буфера в памяти (без загрузки в S3)
+
+        Args:
+            audio_data: Аудио данные в байтах
+
+        Returns:
+            str: Транскрибированный текст
+        """
+        return await self._transcribe(lambda: self._client.listen.v1.media.transcribe_file(
+            request=audio_data,
+            model="nova-2",
+            language="ru",
+            smart_format=True,
+        ))
+
+    @asynccontextmanager
+    async def stream(self, on_transcript: Optional[Callable[[str, bool], Awaitable[None]]] = None):
+        """
+        Открывает потоковую транскрибацию через WebSocket Deepgram
+
+        Args:
+            on_transcript: Колбэк (текст, is_final) для промежуточных и финальных результатов
+
+        Yields:
+            StreamingTranscription: Сессия, принимающая аудио-фреймы
+        """
+        self.start()
+        async with self._client.listen.v1.connect(
+            model="nova-2",
+            language="ru",
+            smart_format="true",
+            interim_results="true",
+        ) as socket:
+            session = StreamingTranscription(socket, on_transcript)
+            try:
+                yield session
+            finally:
+                session.cancel()
+
+
+class StreamingTranscription:
+    """Сессия потоковой транскрибации: пересылает аудио и накапливает транскрипт"""
+
+    def __init__(self, socket, on_transcript: Optional[Callable[[str, bool], Awaitable[None]]] = None):
+        self.socket = socket
+        self.on_transcript = on_transcript
+        self.final_parts: List[str] = []
+        self.interim = ""
+        self._reader = asyncio.create_task(self._read())
+
+    @property
+    def transcript(self) -> str:
+        """Текущий транскрипт: финальные фрагменты и последний промежуточный"""
+        return " ".join(part for part in self.final_parts + [self.interim] if part)
+
+    async def _read(self):
+        async for message in self.socket:
+            if not isinstance(message, ListenV1Results):
+                continue
+            alternatives = message.channel.alternatives if message.channel else []
+            text = alternatives[0].transcript if alternatives else ""
+            if message.is_final:
+                if text:
+                    self.final_parts.append(text)
+                self.interim = ""
+            else:
+                self.interim = text
+            if self.on_transcript is not None:
+                try:
+                    await self.on_transcript(self.transcript, bool(message.is_final))
+                except Exception as e:
+                    print(f"Error in transcript callback: {e}")
+
+    async def send(self, chunk: bytes):
+        """Пересылает аудио-фрейм в Deepgram"""
+        await self.socket.send_media(chunk)
+
+    async def finish(self, timeout: float = 10.0) -> str:
+        """
+        Завершает поток: Deepgram дообрабатывает оставшееся аудио и закрывает соединение
+
+        Returns:
+            str: Итоговый транскрипт
+        """
+        await self.socket.send_close_stream()
+        try:
+            await asyncio.wait_for(self._reader, timeout=timeout)
+        except asyncio.TimeoutError:
+            print("Deepgram stream did not close in time, using partial transcript")
+        except Exception as e:
+            print(f"Deepgram stream failed, using partial transcript: {e}")
+        return " ".join(part for part in self.final_parts if part) or self.interim
+
+    def cancel(self):
+        if not self._reader.done():
+            self._reader.cancel()
+
+
+def _extract_transcript(response) -> str:
+    # Извлекаем транскрипт из ответа
+    if response.results and response.results.channels:
+        if len(response.results.channels) > 0:
+            channel = response.results.channels[0]
+            if channel.alternatives and len(channel.alternatives) > 0:
+                return channel.alternatives[0].transcript
+
+    return ""
+
+
+# Глобальный клиент транскрибации
+transcriber = DeepgramTranscriber(
+    max_connections=Settings.DEEPGRAM_MAX_CONNECTIONS,
+    max_concurrency=Settings.DEEPGRAM_MAX_CONCURRENCY,
+    timeout=Settings.DEEPGRAM_TIMEOUT,
+    max_retries=Settings.DEEPGRAM_MAX_RETRIES
+)
 
 
 async def transcribe_audio(audio_url: str) -> str:
@@ -12,30 +225,23 @@ async def transcribe_audio(audio_url: str) -> str:
     Returns:
         str: Транскрибированный текст
     """
-    deepgram_api_key = os.getenv("DEEPGRAM_API_KEY")
-    if not deepgram_api_key:
-        raise ValueError("DEEPGRAM_API_KEY not found in environment variables")
-
     try:
-        # Инициализируем клиент Deepgram
-        deepgram = DeepgramClient(api_key=deepgram_api_key)
+        return await transcriber.transcribe_url(audio_url)
+    except Exception as e:
+        raise ValueError(f"Failed to transcribe audio with Deepgram: {str(e)}")
 
-        # Транскрибируем аудио по URL
-        response = deepgram.listen.v1.media.transcribe_url(
-            url=audio_url,
-            model="nova-2",
-            language="ru",
-            smart_format=True,
-        )
 
-        # Извлекаем транскрипт из ответа
-        if response.results and response.results.channels:
-            if len(response.results.channels) > 0:
-                channel = response.results.channels[0]
-                if channel.alternatives and len(channel.alternatives) > 0:
-                    print(channel.alternatives[0].transcript)
-                    return channel.alternatives[0].transcript
+async def transcribe_audio_bytes(audio_data: bytes) -> str:
+    """
+    Транскрибирует аудио из буфера в памяти с помощью Deepgram
+
+    Args:
+        audio_data: Аудио данные в байтах
 
-        return ""
+    Returns:
+        str: Транскрибированный текст
+    """
+    try:
+        return await transcriber.transcribe_bytes(audio_data)
     except Exception as e:
-        raise ValueError(f"Failed to transcribe audio with Deepgram: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Failed to transcribe audio with Deepgram: {str(e)}")
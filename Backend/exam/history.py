@@ -0,0 +1,187 @@
+from typing import Dict, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.models import ConversationTurn, ExamSession
+from main.config import Settings
+from exam.model_router import choose_route, routed_completion
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~4 символа на токен)"""
+    return len(text or "") // 4 + 1
+
+
+def _message_tokens(msg: Dict) -> int:
+    return estimate_tokens(msg.get("content", "")) + 4
+
+
+def take_recent_window(messages: List[Dict], max_tokens: int) -> List[Dict]:
+    """
+    Возвращает самые свежие сообщения, укладывающиеся в max_tokens
+
+    Args:
+        messages: История диалога
+        max_tokens: Бюджет токенов окна
+
+    Returns:
+        List[Dict]: Хвост истории (всегда хотя бы одно сообщение, если история не пуста)
+    """
+    window = []
+    used = 0
+    for msg in reversed(messages):
+        tokens = _message_tokens(msg)
+        if window and used + tokens > max_tokens:
+            break
+        window.append(msg)
+        used += tokens
+    window.reverse()
+    return window
+
+
+def format_history(context_history: List[Dict], history_summary: str = "", max_tokens: int = None) -> str:
+    """
+    Формирует текст истории для промпта: краткое содержание старых ходов
+    и ограниченное по токенам окно последних сообщений
+
+    Args:
+        context_history: История диалога
+        history_summary: Накопленное краткое содержание
+        max_tokens: Бюджет токенов окна (по умолчанию HISTORY_WINDOW_TOKENS)
+
+    Returns:
+        str: Текст истории
+    """
+    dialog = [m for m in (context_history or []) if m.get("role") != "system"]
+    window = take_recent_window(dialog, max_tokens or Settings.HISTORY_WINDOW_TOKENS)
+
+    history_text = ""
+    if history_summary:
+        history_text += f"Краткое содержание предыдущего диалога:\n{history_summary}\n\n"
+    for msg in window:
+        role = msg.get("role", "user")
+        content = msg.get("content", "")
+        history_text += f"{role}: {content}\n"
+    return history_text
+
+
+async def summarize_history(
+    previous_summary: str,
+    messages: List[Dict],
+    teacher_name: str,
+    subject: str
+) -> str:
+    """
+    Сворачивает старые сообщения в краткое содержание с помощью OpenAI
+
+    Returns:
+        str: Обновленное краткое содержание
+    """
+    dialog_text = "\n".join(
+        f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+
+    system_prompt = f"""Ты ведешь конспект диалога преподавателя {teacher_name} со студентом по предмету "{subject}".
+
+Обнови краткое содержание диалога с учетом новых сообщений. Сохрани:
+- какие вопросы задавались и какие темы уже обсуждались
+- на что студент ответил верно, а где ошибся
+- как менялось настроение преподавателя
+
+Пиши кратко, не больше 150 слов, только текст конспекта."""
+
+    user_prompt = f"""Текущее краткое содержание:
+{previous_summary or "(пусто)"}
+
+Новые сообщения:
+{dialog_text}"""
+
+    route = choose_route("history_summary")
+    response = await routed_completion(
+        route,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=Settings.HISTORY_SUMMARY_MAX_TOKENS
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+def _session_column(session):
+    if isinstance(session, ExamSession):
+        return ConversationTurn.exam_session_id
+    return ConversationTurn.study_session_id
+
+
+def append_turns(db: AsyncSession, session, messages: List[Dict]):
+    """
+    Добавляет реплики в журнал диалога сессии (ExamSession или StudySession).
+    Запись O(1) на ход: существующие реплики не перезаписываются.
+    Сохраняются при ближайшем commit.
+    """
+    session_key = "exam_session_id" if isinstance(session, ExamSession) else "study_session_id"
+    db.add_all([
+        ConversationTurn(role=m.get("role", "user"), content=m.get("content", ""), **{session_key: session.id})
+        for m in messages
+    ])
+
+
+async def load_history(db: AsyncSession, session) -> List[Dict]:
+    """
+    Читает из журнала реплики, еще не свернутые в history_summary. Хвост
+    ограничен: compact_history не дает ему вырасти больше порога токенов.
+
+    Returns:
+        List[Dict]: [{"id": int, "role": str, "content": str}] в хронологическом порядке
+    """
+    column = _session_column(session)
+    query = select(ConversationTurn.id, ConversationTurn.role, ConversationTurn.content).where(
+        column == session.id)
+    if session.summarized_turn_id is not None:
+        query = query.where(ConversationTurn.id > session.summarized_turn_id)
+
+    result = await db.execute(
+        query.order_by(ConversationTurn.id.desc()).limit(Settings.HISTORY_MAX_TAIL_TURNS))
+    turns = [{"id": row.id, "role": row.role, "content": row.content} for row in result]
+    turns.reverse()
+    return turns
+
+
+async def compact_history(session, history: List[Dict]) -> bool:
+    """
+    Сворачивает старые реплики сессии (ExamSession или StudySession) в
+    history_summary, если несвернутый хвост превысил порог токенов. Журнал
+    не переписывается - сдвигается только summarized_turn_id.
+
+    Args:
+        session: Сессия
+        history: Несвернутый хвост (load_history) и, в конце, новые реплики хода
+
+    Returns:
+        bool: True, если история была свернута
+    """
+    dialog = [m for m in history if m.get("role") != "system"]
+
+    if sum(_message_tokens(m) for m in dialog) < Settings.HISTORY_COMPACT_THRESHOLD_TOKENS:
+        return False
+
+    recent = take_recent_window(dialog, Settings.HISTORY_WINDOW_TOKENS)
+    # Свернуть можно только уже сохраненные реплики (у них есть id)
+    older = [m for m in dialog[:len(dialog) - len(recent)] if m.get("id") is not None]
+    if not older:
+        return False
+
+    try:
+        session.history_summary = await summarize_history(
+            session.history_summary or "",
+            older,
+            session.teacher_name,
+            session.subject
+        )
+    except Exception as e:
+        print(f"Error compacting session history: {e}")
+        return False
+
+    session.summarized_turn_id = older[-1]["id"]
+    return True
@@ -0,0 +1,344 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from main.config import Settings
+from main.metrics import metrics
+
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+
+class LLMUnavailableError(Exception):
+    """LLM временно недоступна (открыт circuit breaker или исчерпаны повторы)"""
+
+
+class TokenBucket:
+    """Асинхронный token bucket с пополнением "capacity в минуту" """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # Очередь ожидающих для каждого уровня reserve
+        self._queues: Dict[float, asyncio.Lock] = {}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0, reserve: float = 0.0):
+        """
+        Ждет, пока в ведре не наберется amount токенов сверх reserve, и списывает их.
+        Вызовы с одинаковым reserve обслуживаются по очереди (FIFO): иначе все
+        ожидающие просыпаются разом, а мелкие запросы бесконечно обгоняют крупные.
+
+        Args:
+            amount: Сколько токенов списать
+            reserve: Сколько токенов оставить в ведре для более приоритетных вызовов
+        """
+        amount = min(amount, max(self.capacity - reserve, 1.0))
+        queue = self._queues.setdefault(reserve, asyncio.Lock())
+        async with queue:
+            while True:
+                self._refill()
+                if self.tokens - reserve >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount + reserve - self.tokens) / self.rate)
+
+    def debit(self, amount: float):
+        """Списывает токены без ожидания (для корректировки по фактическому расходу)"""
+        self._refill()
+        self.tokens -= amount
+
+
+class PriorityScheduler:
+    """
+    Слоты параллелизма с двумя классами приоритета.
+
+    interactive - живые ходы экзамена и подготовки, bulk - загрузка материалов.
+    Каждому классу гарантирована своя доля слотов; остальные слоты общие, но
+    bulk получает общий слот, только если нет ожидающих interactive-вызовов.
+    """
+
+    def __init__(self, max_concurrency: int, interactive_share: float, bulk_share: float):
+        self.max_concurrency = max_concurrency
+        self.reserved = {
+            INTERACTIVE: min(max_concurrency, round(max_concurrency * interactive_share)),
+            BULK: min(max_concurrency, round(max_concurrency * bulk_share)),
+        }
+        self.in_flight = {INTERACTIVE: 0, BULK: 0}
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self._condition = asyncio.Condition()
+
+    def _other(self, priority: str) -> str:
+        return BULK if priority == INTERACTIVE else INTERACTIVE
+
+    def _can_start(self, priority: str) -> bool:
+        other = self._other(priority)
+        if sum(self.in_flight.values()) >= self.max_concurrency:
+            return False
+        # Не занимаем слоты, зарезервированные за другим классом
+        if self.in_flight[priority] >= max(self.max_concurrency - self.reserved[other], 1):
+            return False
+        if priority == BULK and self.in_flight[BULK] >= self.reserved[BULK]:
+            return self.waiting[INTERACTIVE] == 0
+        return True
+
+    async def acquire(self, priority: str):
+        async with self._condition:
+            self.waiting[priority] += 1
+            try:
+                await self._condition.wait_for(lambda: self._can_start(priority))
+            finally:
+                self.waiting[priority] -= 1
+            self.in_flight[priority] += 1
+
+    async def release(self, priority: str):
+        async with self._condition:
+            self.in_flight[priority] -= 1
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Circuit breaker: после N подряд неудачных вызовов блокирует запросы на reset_seconds"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.half_open_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def check(self):
+        """Отказывает сразу, если цепь разомкнута - не ставим такой вызов в очередь"""
+        if self.state == "open":
+            raise LLMUnavailableError("LLM circuit breaker is open")
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.half_open_in_flight):
+            raise LLMUnavailableError("LLM circuit breaker is open")
+        if state == "half_open":
+            self.half_open_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.half_open_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: Optional[int] = None) -> int:
+    """Грубая оценка числа токенов запроса (~4 символа на токен) плюс ответ"""
+    prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return prompt_chars // 4 + (max_tokens or Settings.LLM_DEFAULT_COMPLETION_TOKENS)
+
+
+def estimate_embedding_tokens(input: Union[str, List[str]]) -> int:
+    """Грубая оценка числа токенов запроса эмбеддингов"""
+    texts = [input] if isinstance(input, str) else input
+    return max(sum(len(t) for t in texts) // 4, 1)
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Единая точка вызова OpenAI (chat completions и эмбеддинги): лимиты запросов и
+    токенов в минуту, приоритетные слоты параллелизма, повторы с джиттером на
+    429/5xx и circuit breaker
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_retries: int,
+        failure_threshold: int,
+        reset_seconds: float,
+        interactive_share: float = 0.5,
+        bulk_share: float = 0.1
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.scheduler = PriorityScheduler(max_concurrency, interactive_share, bulk_share)
+        self.interactive_share = interactive_share
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.queued = {INTERACTIVE: 0, BULK: 0}
+
+    def _update_gauges(self):
+        for priority in (INTERACTIVE, BULK):
+            metrics.set_gauge("llm_queue_depth", self.queued[priority], priority=priority)
+            metrics.set_gauge("llm_in_flight", self.scheduler.in_flight[priority], priority=priority)
+        metrics.set_gauge("llm_circuit_open", 0 if self.breaker.state == "closed" else 1)
+
+    async def _acquire(self, priority: str, estimated: int):
+        # bulk расходует только квоту сверх доли, зарезервированной за interactive
+        if priority == BULK:
+            request_reserve = self.request_bucket.capacity * self.interactive_share
+            token_reserve = self.token_bucket.capacity * self.interactive_share
+        else:
+            request_reserve = token_reserve = 0.0
+        # Сначала слот, потом квота: квота не списывается, пока вызов ждет слота
+        await self.scheduler.acquire(priority)
+        try:
+            await self.request_bucket.acquire(1, reserve=request_reserve)
+            await self.token_bucket.acquire(estimated, reserve=token_reserve)
+        except BaseException:
+            await self.scheduler.release(priority)
+            raise
+
+    async def _call(
+        self,
+        call: Callable[[], Awaitable],
+        model: str,
+        estimated: int,
+        priority: str
+    ):
+        for attempt in range(self.max_retries + 1):
+            self.breaker.check()
+
+            queued_at = time.monotonic()
+            self.queued[priority] += 1
+            self._update_gauges()
+            try:
+                await self._acquire(priority, estimated)
+            finally:
+                self.queued[priority] -= 1
+            metrics.observe("llm_queue_wait_seconds", time.monotonic() - queued_at, priority=priority)
+            # Пробный вызов half-open занимаем только с полученным слотом: пока он
+            # ждал в очереди, флаг блокировал бы все остальные вызовы
+            try:
+                self.breaker.before_call()
+            except BaseException:
+                await self.scheduler.release(priority)
+                raise
+
+            self._update_gauges()
+            started = time.monotonic()
+            retry_delay = None
+            try:
+                response = await call()
+            except Exception as e:
+                if not _is_retryable(e):
+                    # Ошибка самого запроса (4xx) - сервис доступен
+                    self.breaker.record_success()
+                    metrics.inc("llm_requests_total", model=model, priority=priority, status="error")
+                    raise
+                self.breaker.record_failure()
+                metrics.inc("llm_requests_total", model=model, priority=priority, status="retryable_error")
+                if attempt >= self.max_retries:
+                    raise LLMUnavailableError(f"LLM request failed after {attempt + 1} attempts: {e}") from e
+                retry_delay = min(_retry_after(e) or random.uniform(
+                    0, Settings.LLM_RETRY_BASE_DELAY * (2 ** attempt)), Settings.LLM_RETRY_MAX_DELAY)
+            except BaseException:
+                # Отмененный пробный вызов не дает исхода - освобождаем место пробы
+                self.breaker.half_open_in_flight = False
+                raise
+            finally:
+                await self.scheduler.release(priority)
+                metrics.observe("llm_request_seconds", time.monotonic() - started,
+                                model=model, priority=priority)
+                self._update_gauges()
+
+            if retry_delay is not None:
+                # Ждем вне слота, чтобы не занимать его во время паузы
+                metrics.inc("llm_retries_total", model=model, priority=priority)
+                await asyncio.sleep(retry_delay)
+                continue
+
+            self.breaker.record_success()
+            metrics.inc("llm_requests_total", model=model, priority=priority, status="ok")
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                metrics.inc("llm_tokens_total", usage.total_tokens, model=model, priority=priority)
+                # Корректируем ведро токенов по фактическому расходу
+                if usage.total_tokens > estimated:
+                    self.token_bucket.debit(usage.total_tokens - estimated)
+            return response
+
+    async def chat_completion(self, priority: str = INTERACTIVE, **kwargs):
+        """
+        Выполняет chat.completions.create через AsyncOpenAI с учетом лимитов
+
+        Args:
+            priority: Класс приоритета ("interactive" или "bulk")
+            **kwargs: Параметры chat.completions.create (model, messages, ...)
+
+        Returns:
+            ChatCompletion: Ответ OpenAI
+        """
+        estimated = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+        return await self._call(
+            lambda: Settings.async_client.chat.completions.create(**kwargs),
+            kwargs.get("model", ""),
+            estimated,
+            priority
+        )
+
+    async def embedding(self, priority: str = INTERACTIVE, **kwargs):
+        """
+        Выполняет embeddings.create через AsyncOpenAI с учетом лимитов
+
+        Args:
+            priority: Класс приоритета ("interactive" или "bulk")
+            **kwargs: Параметры embeddings.create (model, input)
+
+        Returns:
+            CreateEmbeddingResponse: Ответ OpenAI
+        """
+        estimated = estimate_embedding_tokens(kwargs.get("input", ""))
+        return await self._call(
+            lambda: Settings.async_client.embeddings.create(**kwargs),
+            kwargs.get("model", ""),
+            estimated,
+            priority
+        )
+
+
+# Глобальный экземпляр шлюза
+llm_gateway = LLMGateway(
+    requests_per_minute=Settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=Settings.LLM_TOKENS_PER_MINUTE,
+    max_concurrency=Settings.LLM_MAX_CONCURRENCY,
+    max_retries=Settings.LLM_MAX_RETRIES,
+    failure_threshold=Settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=Settings.LLM_CIRCUIT_RESET_SECONDS,
+    interactive_share=Settings.LLM_INTERACTIVE_RESERVED_SHARE,
+    bulk_share=Settings.LLM_BULK_RESERVED_SHARE
+)
@@ -0,0 +1,77 @@
+import time
+from typing import Dict
+from main.config import Settings
+from main.metrics import metrics
+from exam.llm_gateway import llm_gateway, INTERACTIVE
+
+
+# Задачи, для которых всегда достаточно маленькой модели
+SMALL_MODEL_TASKS = {
+    "gender_detection", "off_topic_check", "first_question", "next_question", "history_summary",
+    "question_bank", "question_rephrase"
+}
+
+
+def choose_route(
+    task: str,
+    message: str = "",
+    context: str = "",
+    is_off_topic: bool = False
+) -> Dict:
+    """
+    Выбирает модель для вызова по признакам запроса
+
+    Args:
+        task: Тип вызова (teacher_response, answer_analysis, ...)
+        message: Сообщение или ответ студента
+        context: Найденный контекст материалов
+        is_off_topic: Сообщение не по теме
+
+    Returns:
+        dict: {"task": str, "route": str, "model": str}
+    """
+    message_len = len(message or "")
+    context_len = len(context or "")
+
+    if task in SMALL_MODEL_TASKS:
+        route = "fixed_small"
+    elif is_off_topic:
+        route = "off_topic"
+    elif message_len <= Settings.ROUTER_SHORT_MESSAGE_CHARS and context_len <= Settings.ROUTER_LARGE_CONTEXT_CHARS:
+        route = "short_message"
+    elif message_len >= Settings.ROUTER_LONG_MESSAGE_CHARS or context_len > Settings.ROUTER_LARGE_CONTEXT_CHARS:
+        route = "complex"
+    elif task == "teacher_response":
+        # Объяснения материала по умолчанию дает большая модель
+        route = "complex"
+    else:
+        route = "default_small"
+
+    model = Settings.LLM_LARGE_MODEL if route == "complex" else Settings.LLM_SMALL_MODEL
+    metrics.inc("llm_route_decisions_total", task=task, route=route, model=model)
+    return {"task": task, "route": route, "model": model}
+
+
+async def routed_completion(route: Dict, priority: str = INTERACTIVE, **kwargs):
+    """
+    Выполняет chat completion выбранной моделью через шлюз LLM и логирует
+    задержку и расход токенов по маршруту
+
+    Args:
+        route: Результат choose_route
+        priority: Класс приоритета шлюза
+        **kwargs: Параметры chat.completions.create без model
+
+    Returns:
+        ChatCompletion: Ответ OpenAI
+    """
+    started = time.monotonic()
+    response = await llm_gateway.chat_completion(priority=priority, model=route["model"], **kwargs)
+    elapsed = time.monotonic() - started
+
+    labels = {"task": route["task"], "route": route["route"], "model": route["model"]}
+    metrics.observe("llm_route_seconds", elapsed, **labels)
+    usage = getattr(response, "usage", None)
+    total_tokens = usage.total_tokens if usage is not None else 0
+    metrics.inc("llm_route_tokens_total", total_tokens, **labels)
+    return response
@@ -0,0 +1,154 @@
+import struct
+from typing import List
+
+
+OGG_CAPTURE = b"OggS"
+OGG_HEADER = struct.Struct("<4sBBqIIIB")
+
+FLAG_CONTINUED = 0x01
+FLAG_BOS = 0x02
+FLAG_EOS = 0x04
+
+# Opus: два заголовочных пакета (OpusHead, OpusTags) перед аудио
+OPUS_HEADER_PACKETS = 2
+OPUS_HEAD_MAGIC = b"OpusHead"
+
+
+def _crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) if r & 0x80000000 else (r << 1)
+        table.append(r & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    """CRC32 страницы Ogg (полином 0x04C11DB7, без отражения)"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+
+class OggPage:
+    """Одна страница Ogg: заголовок, таблица сегментов и данные"""
+
+    def __init__(self, flags: int, granule: int, serial: int, sequence: int, segments: bytes, body: bytes):
+        self.flags = flags
+        self.granule = granule
+        self.serial = serial
+        self.sequence = sequence
+        self.segments = segments
+        self.body = body
+
+    @property
+    def completed_packets(self) -> int:
+        """Сколько пакетов заканчивается на этой странице"""
+        return sum(1 for lacing in self.segments if lacing < 255)
+
+    def to_bytes(self) -> bytes:
+        header = OGG_HEADER.pack(
+            OGG_CAPTURE, 0, self.flags, self.granule, self.serial, self.sequence, 0, len(self.segments))
+        page = bytearray(header + self.segments + self.body)
+        struct.pack_into("<I", page, 22, ogg_crc(page))
+        return bytes(page)
+
+
+def parse_pages(data: bytes) -> List[OggPage]:
+    """
+    Разбирает поток Ogg на страницы
+
+    Raises:
+        ValueError: Если данные не являются потоком Ogg
+    """
+    pages = []
+    offset = 0
+    while offset < len(data):
+        if data[offset:offset + 4] != OGG_CAPTURE:
+            raise ValueError(f"Invalid Ogg page at offset {offset}")
+        _, _, flags, granule, serial, sequence, _, segment_count = OGG_HEADER.unpack_from(data, offset)
+        offset += OGG_HEADER.size
+        segments = data[offset:offset + segment_count]
+        offset += segment_count
+        body_size = sum(segments)
+        body = data[offset:offset + body_size]
+        offset += body_size
+        pages.append(OggPage(flags, granule, serial, sequence, segments, body))
+    return pages
+
+
+def opus_pre_skip(page: OggPage) -> int:
+    """
+    Pre-skip из заголовка OpusHead: сколько сэмплов разгона декодера отбросить
+
+    Raises:
+        ValueError: Если страница не начинается с пакета OpusHead
+    """
+    if not page.body.startswith(OPUS_HEAD_MAGIC) or len(page.body) < 12:
+        raise ValueError("Ogg page does not contain an OpusHead packet")
+    return struct.unpack_from("<H", page.body, 10)[0]
+
+
+def concat_opus(streams: List[bytes]) -> bytes:
+    """
+    Склеивает несколько потоков OggOpus в один логический поток без перекодирования:
+    заголовки берутся из первого потока, у остальных отбрасываются, а номера
+    страниц, serial и granule position переписываются подряд. Pre-skip действует
+    только в начале потока, поэтому сэмплы разгона декодера остальных частей
+    вычитаются из granule position - плеер обрезает их с конца (end trim).
+
+    Args:
+        streams: Аудио OggOpus, синтезированное по частям
+
+    Returns:
+        bytes: Единый поток OggOpus
+    """
+    if len(streams) == 1:
+        return streams[0]
+
+    output = []
+    serial = None
+    sequence = 0
+    granule_offset = 0
+    last_page = None
+
+    for index, stream in enumerate(streams):
+        pages = parse_pages(stream)
+        if serial is None and pages:
+            serial = pages[0].serial
+
+        # Pre-skip первого потока остается в его OpusHead и учитывается декодером
+        pre_skip = opus_pre_skip(pages[0]) if index > 0 and pages else 0
+        header_packets = 0
+        stream_granule = 0
+        for page in pages:
+            is_header = header_packets < OPUS_HEADER_PACKETS
+            if is_header:
+                header_packets += page.completed_packets
+                if index > 0:
+                    continue
+            elif page.granule >= 0:
+                stream_granule = page.granule
+
+            page.serial = serial
+            page.sequence = sequence
+            page.flags &= ~FLAG_EOS
+            if index > 0:
+                page.flags &= ~FLAG_BOS
+            if not is_header and page.granule >= 0:
+                page.granule = max(page.granule - pre_skip, 0) + granule_offset
+            sequence += 1
+            output.append(page)
+            last_page = page
+
+        granule_offset += max(stream_granule - pre_skip, 0)
+
+    if last_page is not None:
+        last_page.flags |= FLAG_EOS
+
+    return b"".join(page.to_bytes() for page in output)
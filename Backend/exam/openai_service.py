@@ -1,57 +1,96 @@
 import json
 from typing import List, Dict, Optional
-from main.config import Settings
+from sqlalchemy.ext.asyncio import AsyncSession
+from main.metrics import metrics
+from exam.model_router import choose_route, routed_completion
+from exam.history import format_history
+from exam.teacher_gender import gender_cache, normalize_teacher_name, detect_gender_by_rules, get_stored_gender, store_gender
 
 
-async def detect_teacher_gender(teacher_name: str) -> str:
+async def detect_teacher_gender(teacher_name: str, db: Optional[AsyncSession] = None) -> str:
     """
-    Определяет пол преподавателя по имени с помощью OpenAI
+    Определяет пол преподавателя по имени: LRU-кэш, локальные правила,
+    таблица teacher_genders и только для новых имен - OpenAI
 
     Args:
         teacher_name: Имя преподавателя (например, "Иван Петров" или "Мария Иванова")
+        db: Сессия базы данных для постоянного кэша (опционально)
 
     Returns:
         str: "male" или "female"
     """
-    # Простое правило для русских имен (можно улучшить)
-    female_endings = ["а", "я", "ь"]
-    first_name = teacher_name.split()[0] if teacher_name else ""
-
-    # Если имя заканчивается на типичные женские окончания
-    if first_name and first_name[-1].lower() in female_endings:
-        return "female"
+    key = normalize_teacher_name(teacher_name)
+    if not key:
+        return "male"
 
-    # Используем OpenAI для более точного определения
+    cached = gender_cache.get(key)
+    if cached:
+        metrics.inc("teacher_gender_resolutions_total", source="cache")
+        return cached
+
+    gender = detect_gender_by_rules(teacher_name)
+    if gender:
+        metrics.inc("teacher_gender_resolutions_total", source="rules")
+        gender_cache.set(key, gender)
+        return gender
+
+    if db is not None:
+        try:
+            gender = await get_stored_gender(db, teacher_name)
+        except Exception as e:
+            print(f"Error reading teacher gender from DB: {e}")
+        if gender:
+            metrics.inc("teacher_gender_resolutions_total", source="db")
+            gender_cache.set(key, gender)
+            return gender
+
+    # Имя встречается впервые - используем OpenAI
     try:
-        prompt = f"""Определи пол человека по имени. Верни только "male" или "female" без дополнительных объяснений.
+        gender = await detect_teacher_gender_llm(teacher_name)
+    except Exception:
+        # В случае ошибки не кэшируем результат
+        return "male"
+
+    metrics.inc("teacher_gender_resolutions_total", source="llm")
+    gender_cache.set(key, gender)
+    if db is not None:
+        try:
+            await store_gender(db, teacher_name, gender)
+        except Exception as e:
+            print(f"Error saving teacher gender to DB: {e}")
+            await db.rollback()
+    return gender
+
+
+async def detect_teacher_gender_llm(teacher_name: str) -> str:
+    """
+    Определяет пол преподавателя по имени с помощью OpenAI
+
+    Returns:
+        str: "male" или "female"
+    """
+    prompt = f"""Определи пол человека по имени. Верни только "male" или "female" без дополнительных объяснений.
 
 Имя: {teacher_name}
 
 Пол:"""
 
-        response = Settings.client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Ты помощник, который определяет пол по имени. Отвечай только 'male' или 'female'."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=10
-        )
-
-        result = response.choices[0].message.content.strip().lower()
-        if "female" in result or "жен" in result.lower():
-            return "female"
-        elif "male" in result or "муж" in result.lower():
-            return "male"
-        else:
-            # По умолчанию, если не удалось определить
-            return "male"
-    except Exception:
-        # В случае ошибки используем простое правило
-        if first_name and first_name[-1].lower() in female_endings:
-            return "female"
-        return "male"
+    route = choose_route("gender_detection")
+    response = await routed_completion(
+        route,
+        messages=[
+            {"role": "system", "content": "Ты помощник, который определяет пол по имени. Отвечай только 'male' или 'female'."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.1,
+        max_tokens=10
+    )
+
+    result = response.choices[0].message.content.strip().lower()
+    if "female" in result or "жен" in result.lower():
+        return "female"
+    # По умолчанию, если не удалось определить
+    return "male"
 
 
 def get_voice_by_gender_and_emotion(gender: str, emotion: str) -> str:
@@ -148,8 +187,9 @@ async def generate_first_question(
     "reasoning": "краткое объяснение, почему задан этот вопрос"
 }}"""
 
-    response = Settings.client.chat.completions.create(
-        model="gpt-4o-mini",
+    route = choose_route("first_question", context=materials_context)
+    response = await routed_completion(
+        route,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": "Задай первый вопрос студенту."}
@@ -170,7 +210,9 @@ async def analyze_answer(
     teacher_description: str,
     current_mood: str,
     context_history: List[Dict],
-    materials_context: str = ""
+    materials_context: str = "",
+    is_off_topic: bool = False,
+    history_summary: str = ""
 ) -> Dict:
     """
     Анализирует ответ студента и возвращает вердикт
@@ -185,12 +227,8 @@ async def analyze_answer(
             "exam_completed": bool
         }
     """
-    # Формируем историю диалога
-    history_text = ""
-    for msg in context_history[-5:]:  # Берем последние 5 сообщений
-        role = msg.get("role", "user")
-        content = msg.get("content", "")
-        history_text += f"{role}: {content}\n"
+    # Формируем историю диалога: краткое содержание + свежее окно
+    history_text = format_history(context_history, history_summary)
 
     system_prompt = f"""Ты - преподаватель {teacher_name}, который проводит экзамен по предмету "{subject}".
 
@@ -241,8 +279,10 @@ async def analyze_answer(
 
 Проанализируй ответ и верни вердикт в формате JSON."""
 
-    response = Settings.client.chat.completions.create(
-        model="gpt-4o-mini",
+    route = choose_route("answer_analysis", message=answer,
+                         context=materials_context + history_text, is_off_topic=is_off_topic)
+    response = await routed_completion(
+        route,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -262,7 +302,8 @@ async def generate_next_question(
     current_mood: str,
     context_history: List[Dict],
     materials_context: str = "",
-    question_index: int = 0
+    question_index: int = 0,
+    history_summary: str = ""
 ) -> Dict:
     """
     Генерирует следующий вопрос экзамена
@@ -270,11 +311,7 @@ async def generate_next_question(
     Returns:
         dict: {"question": str, "reasoning": str}
     """
-    history_text = ""
-    for msg in context_history[-5:]:
-        role = msg.get("role", "user")
-        content = msg.get("content", "")
-        history_text += f"{role}: {content}\n"
+    history_text = format_history(context_history, history_summary)
 
     system_prompt = f"""Ты - преподаватель {teacher_name}, который проводит экзамен по предмету "{subject}".
 
@@ -301,8 +338,9 @@ async def generate_next_question(
     "reasoning": "краткое объяснение, почему задан этот вопрос"
 }}"""
 
-    response = Settings.client.chat.completions.create(
-        model="gpt-4o-mini",
+    route = choose_route("next_question", context=materials_context)
+    response = await routed_completion(
+        route,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": "Задай следующий вопрос студенту."}
@@ -1,11 +1,13 @@
 import os
+import asyncio
 import uuid
 import hashlib
+import math
 from typing import List, Optional, Dict
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
 from main.config import Settings
-from openai import OpenAI
+from exam.llm_gateway import llm_gateway, LLMUnavailableError, INTERACTIVE, BULK
 
 
 class QdrantService:
@@ -46,6 +48,9 @@ class QdrantService:
         # Инициализация OpenAI для эмбеддингов
         self.openai_client = Settings.client
 
+        # Кэш центроидов эмбеддингов по предметам
+        self._centroids: Dict[str, List[float]] = {}
+
         # Создаем коллекцию, если её нет
         self._ensure_collection()
 
@@ -72,48 +77,36 @@ class QdrantService:
         except Exception as e:
             print(f"Error ensuring collection: {e}")
 
-    def _get_embedding(self, text: str) -> List[float]:
-        """Получает эмбеддинг текста через OpenAI"""
+    async def _get_embeddings(self, texts: List[str], priority: str = INTERACTIVE) -> List[List[float]]:
+        """Получает эмбеддинги списка текстов одним запросом через шлюз LLM"""
         if self.openai_client is None:
             raise ValueError("OpenAI client is not initialized")
 
         try:
-            response = self.openai_client.embeddings.create(
+            response = await llm_gateway.embedding(
+                priority=priority,
                 model=self.embedding_model,
-                input=text
+                input=texts
             )
-            return response.data[0].embedding
+            return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise ValueError(f"Failed to get embedding: {str(e)}")
 
-    def add_document(
+    async def _get_embedding(self, text: str, priority: str = INTERACTIVE) -> List[float]:
+        """Получает эмбеддинг текста через OpenAI"""
+        embeddings = await self._get_embeddings([text], priority=priority)
+        return embeddings[0]
+
+    def _build_point(
         self,
         subject: str,
         content: str,
-        document_id: Optional[str] = None,
+        embedding: List[float],
+        document_id: str,
         metadata: Optional[Dict] = None
-    ) -> str:
-        """
-        Добавляет документ в Qdrant
-
-        Args:
-            subject: Предмет
-            content: Содержимое документа
-            document_id: ID документа (если None, генерируется автоматически)
-            metadata: Дополнительные метаданные
-
-        Returns:
-            str: ID добавленного документа
-        """
-        if self.client is None:
-            raise ValueError("Qdrant client is not initialized")
-
-        if document_id is None:
-            document_id = str(uuid.uuid4())
-
-        # Получаем эмбеддинг
-        embedding = self._get_embedding(content)
-
+    ) -> PointStruct:
         # Формируем метаданные
         point_metadata = {
             "subject": subject,
@@ -128,21 +121,85 @@ class QdrantService:
         point_id = int(hashlib.md5(
             unique_string.encode()).hexdigest()[:15], 16)
 
-        # Добавляем точку в коллекцию
-        point = PointStruct(
+        return PointStruct(
             id=point_id,
             vector=embedding,
             payload=point_metadata
         )
 
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[point]
+    async def add_document(
+        self,
+        subject: str,
+        content: str,
+        document_id: Optional[str] = None,
+        metadata: Optional[Dict] = None,
+        priority: str = BULK
+    ) -> str:
+        """
+        Добавляет документ в Qdrant
+
+        Args:
+            subject: Предмет
+            content: Содержимое документа
+            document_id: ID документа (если None, генерируется автоматически)
+            metadata: Дополнительные метаданные
+            priority: Класс приоритета для запроса эмбеддинга
+
+        Returns:
+            str: ID добавленного документа
+        """
+        document_ids = await self.add_documents(
+            subject,
+            [content],
+            [document_id or str(uuid.uuid4())],
+            [metadata],
+            priority=priority
         )
+        return document_ids[0]
+
+    async def add_documents(
+        self,
+        subject: str,
+        contents: List[str],
+        document_ids: List[str],
+        metadatas: List[Optional[Dict]],
+        priority: str = BULK
+    ) -> List[str]:
+        """
+        Добавляет пачку документов в Qdrant: эмбеддинги запрашиваются батчами,
+        точки записываются одним upsert на батч
+
+        Args:
+            subject: Предмет
+            contents: Содержимое документов
+            document_ids: ID документов
+            metadatas: Дополнительные метаданные для каждого документа
+            priority: Класс приоритета для запросов эмбеддингов
 
-        return document_id
+        Returns:
+            List[str]: ID добавленных документов
+        """
+        if self.client is None:
+            raise ValueError("Qdrant client is not initialized")
+
+        batch_size = Settings.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(contents), batch_size):
+            batch = contents[start:start + batch_size]
+            embeddings = await self._get_embeddings(batch, priority=priority)
+            points = [
+                self._build_point(subject, content, embedding,
+                                  document_ids[start + i], metadatas[start + i])
+                for i, (content, embedding) in enumerate(zip(batch, embeddings))
+            ]
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=points
+            )
+        self._centroids.pop(subject, None)
+
+        return document_ids
 
-    def search_similar(
+    async def search_similar(
         self,
         query: str,
         subject: Optional[str] = None,
@@ -163,7 +220,7 @@ class QdrantService:
             raise ValueError("Qdrant client is not initialized")
 
         # Получаем эмбеддинг запроса
-        query_embedding = self._get_embedding(query)
+        query_embedding = await self._get_embedding(query)
 
         # Формируем фильтр
         query_filter = None
@@ -199,7 +256,7 @@ class QdrantService:
 
         return results
 
-    def get_subject_materials(
+    async def get_subject_materials(
         self,
         subject: str,
         query: Optional[str] = None,
@@ -221,10 +278,10 @@ class QdrantService:
 
         if query:
             # Если есть запрос, используем семантический поиск
-            results = self.search_similar(query, subject=subject, limit=limit)
+            results = await self.search_similar(query, subject=subject, limit=limit)
         else:
             # Иначе ищем все документы по предмету
-            results = self.search_similar(
+            results = await self.search_similar(
                 subject, subject=subject, limit=limit)
 
         if not results:
@@ -237,6 +294,100 @@ class QdrantService:
 
         return "\n\n---\n\n".join(materials)
 
+    async def get_subject_centroid(self, subject: str) -> Optional[List[float]]:
+        """
+        Возвращает нормированный центроид эмбеддингов чанков предмета (с кэшированием).
+        Обход векторов и суммирование выполняются в пуле потоков, не блокируя event loop.
+
+        Args:
+            subject: Предмет
+
+        Returns:
+            Optional[List[float]]: Центроид или None, если материалов нет
+        """
+        if self.client is None:
+            return None
+
+        if subject in self._centroids:
+            return self._centroids[subject]
+
+        centroid = await asyncio.to_thread(self._compute_subject_centroid, subject)
+        if centroid is not None:
+            self._centroids[subject] = centroid
+        return centroid
+
+    def _compute_subject_centroid(self, subject: str) -> Optional[List[float]]:
+        subject_filter = Filter(
+            must=[
+                FieldCondition(
+                    key="subject",
+                    match=MatchValue(value=subject)
+                )
+            ]
+        )
+
+        centroid = [0.0] * self.embedding_dimension
+        count = 0
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=subject_filter,
+                limit=256,
+                offset=offset,
+                with_payload=False,
+                with_vectors=True
+            )
+            for point in points:
+                norm = math.sqrt(sum(v * v for v in point.vector)) or 1.0
+                for i, v in enumerate(point.vector):
+                    centroid[i] += v / norm
+                count += 1
+            if offset is None:
+                break
+
+        if count == 0:
+            return None
+
+        norm = math.sqrt(sum(v * v for v in centroid)) or 1.0
+        return [v / norm for v in centroid]
+
+    async def get_subject_similarity(
+        self,
+        text: str,
+        subject: str,
+        mode: str = "top_k",
+        top_k: int = 3
+    ) -> Optional[float]:
+        """
+        Оценивает близость текста к материалам предмета
+
+        Args:
+            text: Текст сообщения
+            subject: Предмет
+            mode: "top_k" - среднее косинусное сходство с top-k чанками,
+                  "centroid" - сходство с центроидом чанков предмета
+            top_k: Количество чанков для режима top_k
+
+        Returns:
+            Optional[float]: Косинусное сходство или None, если материалов нет
+        """
+        if self.client is None:
+            return None
+
+        if mode == "centroid":
+            centroid = await self.get_subject_centroid(subject)
+            if centroid is None:
+                return None
+            embedding = await self._get_embedding(text)
+            norm = math.sqrt(sum(v * v for v in embedding)) or 1.0
+            return sum(a * b for a, b in zip(embedding, centroid)) / norm
+
+        results = await self.search_similar(text, subject=subject, limit=top_k)
+        if not results:
+            return None
+        return sum(r["score"] for r in results) / len(results)
+
     def delete_document(self, document_id: str):
         """Удаляет документ из Qdrant"""
         if self.client is None:
@@ -275,6 +426,7 @@ class QdrantService:
                 collection_name=self.collection_name,
                 points_selector=point_ids
             )
+        self._centroids.pop(subject, None)
 
 
 # Глобальный экземпляр сервиса
@@ -0,0 +1,257 @@
+import asyncio
+import json
+from typing import Dict, List, Optional
+from sqlalchemy import select, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.database import AsyncSessionLocal, end_read_transaction
+from auth.models import QuestionBankItem, ExamQuestion
+from main.config import Settings
+from main.metrics import metrics
+from exam.llm_gateway import BULK
+from exam.model_router import choose_route, routed_completion
+
+
+DIFFICULTIES = ("easy", "medium", "hard")
+
+# Какую сложность предпочитает преподаватель в зависимости от настроения
+MOOD_DIFFICULTY = {
+    "happy": "hard",
+    "neutral": "medium",
+    "disappointed": "easy",
+    "angry": "easy"
+}
+
+
+def cluster_chunks(chunks: List[str], chunk_ids: List[str], cluster_size: int) -> List[Dict]:
+    """
+    Группирует соседние чанки в кластеры (соседние чанки обычно относятся к одной теме)
+
+    Returns:
+        List[Dict]: [{"content": str, "chunk_ids": List[str]}]
+    """
+    clusters = []
+    for start in range(0, len(chunks), cluster_size):
+        clusters.append({
+            "content": "\n\n".join(chunks[start:start + cluster_size]),
+            "chunk_ids": chunk_ids[start:start + cluster_size]
+        })
+    return clusters
+
+
+async def generate_cluster_questions(subject: str, content: str) -> List[Dict]:
+    """
+    Генерирует вопросы-кандидаты по фрагменту материалов
+
+    Returns:
+        List[Dict]: [{"question": str, "difficulty": str}]
+    """
+    system_prompt = f"""Ты составляешь банк экзаменационных вопросов по предмету "{subject}".
+
+По фрагменту материалов составь {Settings.QUESTION_BANK_QUESTIONS_PER_CLUSTER} вопроса(ов) для устного экзамена разной сложности.
+Вопросы должны проверять понимание, быть четко сформулированы и отвечать на них можно только по этому фрагменту.
+
+Верни ответ в формате JSON:
+{{
+    "questions": [
+        {{"question": "текст вопроса", "difficulty": "easy/medium/hard"}}
+    ]
+}}"""
+
+    route = choose_route("question_bank")
+    response = await routed_completion(
+        route,
+        priority=BULK,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Фрагмент материалов:\n{content}"}
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.7
+    )
+
+    result = json.loads(response.choices[0].message.content)
+    questions = []
+    for item in result.get("questions", []):
+        question = (item.get("question") or "").strip()
+        if not question:
+            continue
+        difficulty = item.get("difficulty")
+        questions.append({
+            "question": question,
+            "difficulty": difficulty if difficulty in DIFFICULTIES else "medium"
+        })
+    return questions
+
+
+async def build_question_bank(subject: str, chunks: List[str], chunk_ids: List[str]) -> int:
+    """
+    Пакетно генерирует вопросы по кластерам чанков загруженных материалов и
+    сохраняет их в банк. Запускается в фоне после загрузки материалов.
+
+    Args:
+        subject: Предмет
+        chunks: Тексты чанков
+        chunk_ids: ID чанков в Qdrant (в том же порядке)
+
+    Returns:
+        int: Количество сохраненных вопросов
+    """
+    clusters = cluster_chunks(chunks, chunk_ids, Settings.QUESTION_BANK_CLUSTER_SIZE)
+
+    async def process(cluster: Dict) -> List[QuestionBankItem]:
+        try:
+            questions = await generate_cluster_questions(subject, cluster["content"])
+        except Exception as e:
+            print(f"Error generating bank questions: {e}")
+            return []
+        return [
+            QuestionBankItem(
+                subject=subject,
+                question_text=q["question"],
+                difficulty=q["difficulty"],
+                source_chunk_ids=cluster["chunk_ids"]
+            )
+            for q in questions
+        ]
+
+    # Параллелизм и приоритет ограничивает шлюз LLM (класс bulk)
+    results = await asyncio.gather(*(process(c) for c in clusters))
+    items = [item for cluster_items in results for item in cluster_items]
+
+    async with AsyncSessionLocal() as db:
+        db.add_all(items)
+        await db.commit()
+
+    metrics.inc("question_bank_generated_total", len(items), subject=subject)
+    print(f"✅ Question bank: {len(items)} questions generated for {subject}")
+    return len(items)
+
+
+async def draw_question(
+    db: AsyncSession,
+    subject: str,
+    exam_session_id: Optional[int] = None,
+    teacher_mood: str = "neutral"
+) -> Optional[QuestionBankItem]:
+    """
+    Берет из банка вопрос, который еще не задавался в этой сессии, предпочитая
+    сложность по настроению преподавателя и наименее использованные вопросы
+
+    Returns:
+        Optional[QuestionBankItem]: Вопрос или None, если банк исчерпан
+    """
+    query = select(QuestionBankItem).where(QuestionBankItem.subject == subject)
+    if exam_session_id is not None:
+        asked = select(ExamQuestion.bank_question_id).where(
+            ExamQuestion.exam_session_id == exam_session_id,
+            ExamQuestion.bank_question_id.is_not(None)
+        )
+        query = query.where(QuestionBankItem.id.not_in(asked))
+
+    preferred = MOOD_DIFFICULTY.get(teacher_mood, "medium")
+    result = await db.execute(
+        query.order_by(
+            (QuestionBankItem.difficulty != preferred),
+            QuestionBankItem.times_used,
+            func.random()
+        ).limit(1)
+    )
+    item = result.scalar_one_or_none()
+
+    if item is None:
+        metrics.inc("question_bank_draws_total", subject=subject, result="miss")
+        return None
+
+    metrics.inc("question_bank_draws_total", subject=subject, result="hit")
+    return item
+
+
+async def mark_question_used(db: AsyncSession, bank_question_id: Optional[int]):
+    """
+    Увеличивает счетчик использования вопроса банка. Выполняется в транзакции,
+    сохраняющей вопрос экзамена, а не во время выбора вопроса.
+    """
+    if bank_question_id is None:
+        return
+    await db.execute(
+        update(QuestionBankItem)
+        .where(QuestionBankItem.id == bank_question_id)
+        .values(times_used=QuestionBankItem.times_used + 1)
+    )
+
+
+async def rephrase_question(
+    question: str,
+    teacher_name: str,
+    subject: str,
+    teacher_description: str,
+    current_mood: str = "neutral"
+) -> str:
+    """
+    Переформулирует вопрос из банка в манере преподавателя
+
+    Returns:
+        str: Вопрос с живой речью преподавателя
+    """
+    system_prompt = f"""Ты - преподаватель {teacher_name}, который проводит экзамен по предмету "{subject}".
+
+Описание преподавателя: {teacher_description}
+
+Текущее настроение преподавателя: {current_mood}
+
+Перескажи вопрос своими словами, как РЕАЛЬНЫЙ преподаватель вуза, с естественными междометиями ("Кхм...", "Так-с...", "Ну..."), не меняя его смысла.
+
+Отвечай ТОЛЬКО текстом вопроса."""
+
+    route = choose_route("question_rephrase")
+    response = await routed_completion(
+        route,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ],
+        temperature=0.7
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+async def get_bank_question(
+    db: AsyncSession,
+    subject: str,
+    teacher_name: str,
+    teacher_description: str,
+    teacher_mood: str = "neutral",
+    exam_session_id: Optional[int] = None
+) -> Optional[Dict]:
+    """
+    Возвращает вопрос из банка (при QUESTION_BANK_REPHRASE - в манере преподавателя).
+    Транзакция чтения завершается до переформулировки; счетчик использования
+    увеличивает mark_question_used при сохранении вопроса.
+
+    Returns:
+        Optional[dict]: {"question": str, "bank_question_id": int} или None,
+        если банк пуст и нужна генерация на лету
+    """
+    if not Settings.QUESTION_BANK_ENABLED:
+        return None
+
+    try:
+        item = await draw_question(db, subject, exam_session_id, teacher_mood)
+        await end_read_transaction(db)
+    except Exception as e:
+        print(f"Error drawing question from bank: {e}")
+        return None
+
+    if item is None:
+        return None
+
+    question_text = item.question_text
+    if Settings.QUESTION_BANK_REPHRASE:
+        try:
+            question_text = await rephrase_question(
+                question_text, teacher_name, subject, teacher_description, teacher_mood)
+        except Exception as e:
+            print(f"Error rephrasing bank question: {e}")
+
+    return {"question": question_text, "bank_question_id": item.id}
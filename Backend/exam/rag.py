@@ -1,9 +1,11 @@
+import asyncio
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from auth.models import SubjectMaterials
 from main.config import Settings
 from exam.qdrant_service import qdrant_service
+from exam.llm_gateway import BULK
 
 
 async def get_subject_materials(db: AsyncSession, subject: str, query: Optional[str] = None) -> str:
@@ -20,7 +22,7 @@ async def get_subject_materials(db: AsyncSession, subject: str, query: Optional[
     """
     # Используем Qdrant для получения материалов
     try:
-        materials = qdrant_service.get_subject_materials(
+        materials = await qdrant_service.get_subject_materials(
             subject, query=query, limit=10)
         if materials:
             return materials
@@ -53,7 +55,7 @@ async def save_subject_materials(db: AsyncSession, subject: str, content: str):
     """
     # Сохраняем в Qdrant
     try:
-        qdrant_service.add_document(
+        await qdrant_service.add_document(
             subject=subject,
             content=content,
             metadata={"source": "text_upload"}
@@ -88,7 +90,9 @@ async def save_pdf_to_qdrant(
     from exam.pdf_parser import split_text_into_chunks
     import uuid
 
+    contents = []
     document_ids = []
+    metadatas = []
 
     for page_num, page_text in enumerate(pdf_pages):
         # Разбиваем страницу на чанки
@@ -96,24 +100,70 @@ async def save_pdf_to_qdrant(
             page_text, chunk_size=1000, overlap=200)
 
         for chunk_num, chunk in enumerate(chunks):
-            chunk_metadata = {
+            contents.append(chunk)
+            document_ids.append(str(uuid.uuid4()))
+            metadatas.append({
                 "source": "pdf",
                 "page": page_num + 1,
                 "chunk": chunk_num + 1,
                 **(metadata or {})
-            }
-
-            document_id = qdrant_service.add_document(
-                subject=subject,
-                content=chunk,
-                document_id=str(uuid.uuid4()),
-                metadata=chunk_metadata
-            )
-            document_ids.append(document_id)
+            })
+
+    # Эмбеддинги считаются батчами с низким приоритетом, чтобы не мешать экзаменам
+    await qdrant_service.add_documents(
+        subject=subject,
+        contents=contents,
+        document_ids=document_ids,
+        metadatas=metadatas,
+        priority=BULK
+    )
 
     return document_ids
 
 
+async def ingest_pdf_from_storage(subject: str, key: str, metadata: Optional[dict] = None) -> int:
+    """
+    Загружает в Qdrant PDF, который клиент положил в S3 напрямую, и строит
+    по нему банк вопросов. Запускается в фоне после подтверждения загрузки.
+
+    Args:
+        subject: Предмет
+        key: Ключ объекта в S3
+        metadata: Дополнительные метаданные
+
+    Returns:
+        int: Количество сохраненных чанков
+    """
+    from exam.pdf_parser import parse_pdf_from_bytes, split_text_into_chunks
+    from exam.question_bank import build_question_bank
+    from main.storage import storage
+
+    try:
+        pdf_data = await storage.get_object_bytes(key)
+        pdf_pages = await asyncio.to_thread(parse_pdf_from_bytes, pdf_data)
+        if not pdf_pages:
+            print(f"PDF {key} is empty or could not be parsed")
+            return 0
+
+        document_ids = await save_pdf_to_qdrant(
+            subject=subject,
+            pdf_pages=pdf_pages,
+            metadata={"s3_key": key, **(metadata or {})}
+        )
+    except Exception as e:
+        print(f"Error ingesting uploaded PDF {key}: {e}")
+        return 0
+
+    # Чанки в том же порядке, что и в save_pdf_to_qdrant
+    chunks = [chunk for page in pdf_pages for chunk in split_text_into_chunks(
+        page, chunk_size=1000, overlap=200)]
+    if Settings.QUESTION_BANK_ENABLED:
+        await build_question_bank(subject, chunks, document_ids)
+
+    print(f"✅ Ingested {len(chunks)} chunks from {key} for {subject}")
+    return len(chunks)
+
+
 async def build_rag_context(
     db: AsyncSession,
     subject: str,
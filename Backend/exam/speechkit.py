@@ -1,40 +1,174 @@
-import requests
-import os
+import asyncio
+import hashlib
+import random
+import re
+import time
+from typing import Dict, List, Optional
+import httpx
 from main.config import Settings
+from main.cache import LRUCache
+from main.metrics import metrics
+from main.storage import storage
+from exam.ogg import concat_opus
 import uuid
 
+TTS_FORMAT = "oggopus"
+TTS_LANG = "ru-RU"
 
-async def synthesize_speech(text: str, voice: str = "jane", emotion: str = "neutral") -> bytes:
-    url = "https://tts.api.cloud.yandex.net/speech/v1/tts:synthesize"
+# Локальный индекс: ключ синтеза -> URL в S3
+tts_url_cache = LRUCache(maxsize=Settings.TTS_CACHE_SIZE)
+_tts_in_flight: Dict[str, asyncio.Future] = {}
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+class SpeechKitClient:
+    """
+    Асинхронный клиент Yandex SpeechKit: общий keep-alive пул соединений,
+    ограничение параллелизма и повторы с экспоненциальной задержкой
+    """
+
+    def __init__(self, url: str, max_connections: int, max_concurrency: int, timeout: float, max_retries: int):
+        self.url = url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5.0)
+            )
+        return self._client
+
+    async def synthesize(self, text: str, voice: str = "jane", emotion: str = "neutral") -> bytes:
+        headers = {
+            "Authorization": f"Bearer {Settings.IAM_TOKEN}"
+        }
+
+        data = {
+            "text": text,
+            "lang": TTS_LANG,
+            "voice": voice,
+            "emotion": emotion,
+            "format": TTS_FORMAT,
+            "folderId": Settings.FOLDER_ID
+        }
 
-    headers = {
-        "Authorization": f"Bearer {Settings.IAM_TOKEN}"
-    }
+        client = self._get_client()
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                async with self.semaphore:
+                    response = await client.post(self.url, headers=headers, data=data)
+                response.raise_for_status()
+                metrics.observe("tts_synthesis_seconds", time.monotonic() - started)
+                return response.content
+            except httpx.HTTPStatusError as e:
+                status_code = e.response.status_code
+                if (status_code != 429 and status_code < 500) or attempt >= self.max_retries:
+                    raise
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            metrics.inc("tts_retries_total")
+            await asyncio.sleep(random.uniform(0, Settings.SPEECHKIT_RETRY_BASE_DELAY * (2 ** attempt)))
 
-    data = {
-        "text": text,
-        "lang": "ru-RU",
-        "voice": voice,
-        "emotion": emotion,
-        "format": "oggopus",
-        "folderId": Settings.FOLDER_ID
-    }
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
+
+# Глобальный клиент SpeechKit
+speechkit_client = SpeechKitClient(
+    url=Settings.SPEECHKIT_URL,
+    max_connections=Settings.SPEECHKIT_MAX_CONNECTIONS,
+    max_concurrency=Settings.SPEECHKIT_MAX_CONCURRENCY,
+    timeout=Settings.SPEECHKIT_TIMEOUT,
+    max_retries=Settings.SPEECHKIT_MAX_RETRIES
+)
+
+
+async def synthesize_speech(text: str, voice: str = "jane", emotion: str = "neutral") -> bytes:
     try:
-        response = requests.post(url, headers=headers, data=data, timeout=30)
-        response.raise_for_status()
-        return response.content
-    except requests.exceptions.RequestException as e:
+        return await speechkit_client.synthesize(text, voice, emotion)
+    except httpx.HTTPError as e:
         raise ValueError(f"Failed to synthesize speech: {str(e)}")
 
 
-async def save_audio_to_s3(audio_data: bytes, filename: str = None) -> str:
+def split_text_for_tts(text: str, max_chars: int) -> List[str]:
+    """
+    Делит текст на части по границам предложений, каждая не длиннее max_chars
+    (предложение длиннее лимита делится по словам)
+    """
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def synthesize_long_speech(text: str, voice: str = "jane", emotion: str = "neutral") -> bytes:
+    """
+    Синтезирует речь; длинный текст делится по предложениям, части синтезируются
+    параллельно (не больше TTS_MAX_PARALLEL_CHUNKS одновременно) и склеиваются
+    в один поток OggOpus без перекодирования
+
+    Returns:
+        bytes: Аудио в формате OggOpus
+    """
+    chunks = split_text_for_tts(text, Settings.TTS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return await synthesize_speech(text, voice, emotion)
+
+    fan_out = asyncio.Semaphore(Settings.TTS_MAX_PARALLEL_CHUNKS)
+
+    async def synthesize_chunk(chunk: str) -> bytes:
+        async with fan_out:
+            return await synthesize_speech(chunk, voice, emotion)
+
+    started = time.monotonic()
+    parts = await asyncio.gather(*(synthesize_chunk(chunk) for chunk in chunks))
+    metrics.observe("tts_chunked_synthesis_seconds", time.monotonic() - started)
+    metrics.inc("tts_chunks_total", len(chunks))
+
+    try:
+        return concat_opus(parts)
+    except ValueError as e:
+        raise ValueError(f"Failed to concatenate synthesized speech: {str(e)}")
+
+
+async def save_audio_to_s3(audio_data: bytes, filename: str = None, content_type: str = "audio/mp3") -> str:
     """
     Сохраняет аудио в S3 и возвращает URL
 
     Args:
         audio_data: Аудио данные в байтах
         filename: Имя файла (если None, генерируется UUID)
+        content_type: MIME-тип аудио
 
     Returns:
         str: URL файла в S3
@@ -42,19 +176,40 @@ async def save_audio_to_s3(audio_data: bytes, filename: str = None) -> str:
     if filename is None:
         filename = f"{uuid.uuid4()}.mp3"
 
-    Settings.S3_CLIENT.put_object(
-        Bucket=Settings.S3_BUCKET,
-        Key=filename,
-        Body=audio_data,
-        ContentType="audio/mp3"
-    )
+    return await storage.put_object(filename, audio_data, content_type)
+
 
-    return f"{Settings.S3_ENDPOINT}/{Settings.S3_BUCKET}/{filename}"
+def tts_cache_key(text: str, voice: str, emotion: str, audio_format: str = TTS_FORMAT) -> str:
+    """Ключ кэша синтеза: hash(text, voice, emotion, format)"""
+    payload = "\x1f".join([text, voice, emotion, audio_format, TTS_LANG])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _tts_filename(key: str) -> str:
+    return f"tts/{key}.mp3"
+
+
+async def _synthesize_and_store(text: str, voice: str, emotion: str, key: str) -> str:
+    filename = _tts_filename(key)
+
+    # Файл мог быть создан другим инстансом - проверяем S3 перед синтезом
+    try:
+        if await storage.object_exists(filename):
+            metrics.inc("tts_cache_total", result="hit_s3")
+            return storage.url(filename)
+    except Exception as e:
+        print(f"Error checking TTS cache in S3: {e}")
+
+    metrics.inc("tts_cache_total", result="miss")
+    audio_data = await synthesize_long_speech(text, voice, emotion)
+    return await save_audio_to_s3(audio_data, filename)
 
 
 async def text_to_speech_url(text: str, voice: str = "jane", emotion: str = "neutral") -> str:
     """
-    Конвертирует текст в речь и сохраняет в S3
+    Конвертирует текст в речь и сохраняет в S3. Результаты кэшируются по
+    hash(text, voice, emotion, format): повторная фраза сразу возвращает
+    существующий URL без синтеза и загрузки.
 
     Args:
         text: Текст для синтеза
@@ -64,5 +219,20 @@ async def text_to_speech_url(text: str, voice: str = "jane", emotion: str = "neu
     Returns:
         str: URL аудио файла в S3
     """
-    audio_data = await synthesize_speech(text, voice, emotion)
-    return await save_audio_to_s3(audio_data)
+    key = tts_cache_key(text, voice, emotion)
+
+    cached_url = tts_url_cache.get(key)
+    if cached_url:
+        metrics.inc("tts_cache_total", result="hit_local")
+        return cached_url
+
+    # Одинаковые фразы, запрошенные одновременно, синтезируются один раз
+    task = _tts_in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_synthesize_and_store(text, voice, emotion, key))
+        _tts_in_flight[key] = task
+        task.add_done_callback(lambda _: _tts_in_flight.pop(key, None))
+
+    url = await asyncio.shield(task)
+    tts_url_cache.set(key, url)
+    return url
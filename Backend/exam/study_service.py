@@ -1,9 +1,93 @@
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from main.config import Settings
+from main.metrics import metrics
+from exam.model_router import choose_route, routed_completion
+from exam.history import format_history
+from exam.qdrant_service import qdrant_service
+
+
+def get_off_topic_thresholds(subject: str) -> Tuple[float, float]:
+    """
+    Возвращает пороги локального фильтра для предмета
+
+    Returns:
+        Tuple[float, float]: (нижний порог, верхний порог) косинусного сходства
+    """
+    thresholds = Settings.OFF_TOPIC_SUBJECT_THRESHOLDS.get(subject)
+    if thresholds and len(thresholds) == 2:
+        return float(thresholds[0]), float(thresholds[1])
+    return Settings.OFF_TOPIC_LOW_THRESHOLD, Settings.OFF_TOPIC_HIGH_THRESHOLD
+
+
+async def local_off_topic_check(user_message: str, subject: str) -> Optional[Dict]:
+    """
+    Первая ступень проверки "не по теме" по сходству эмбеддингов с материалами в Qdrant
+
+    Returns:
+        Optional[Dict]: Результат в формате check_if_off_topic или None,
+        если сообщение попало в неоднозначную зону и нужна проверка через LLM
+    """
+    if not Settings.OFF_TOPIC_GATE_ENABLED:
+        return None
+
+    try:
+        similarity = await qdrant_service.get_subject_similarity(
+            user_message,
+            subject,
+            mode=Settings.OFF_TOPIC_GATE_MODE,
+            top_k=Settings.OFF_TOPIC_TOP_K
+        )
+    except Exception as e:
+        print(f"Error in local off-topic check: {e}")
+        return None
+
+    if similarity is None:
+        return None
+
+    low, high = get_off_topic_thresholds(subject)
+    if similarity >= high:
+        return {"is_off_topic": False, "redirect_message": None}
+    if similarity < low:
+        return {
+            "is_off_topic": True,
+            "redirect_message": f"Кхм... Давай вернемся к предмету. Мы сейчас занимаемся {subject}, давай сосредоточимся на этом."
+        }
+    return None
+
+
+def _record_off_topic_decision(subject: str, decision: str):
+    """Обновляет счетчики решений фильтра и долю эскалаций в LLM по предмету"""
+    metrics.inc("off_topic_checks_total", decision=decision, subject=subject)
+    total = sum(
+        metrics.get_counter("off_topic_checks_total", decision=d, subject=subject)
+        for d in ("on_topic", "off_topic", "escalated")
+    )
+    escalated = metrics.get_counter(
+        "off_topic_checks_total", decision="escalated", subject=subject)
+    metrics.set_gauge("off_topic_escalation_rate",
+                      escalated / total if total else 0.0, subject=subject)
 
 
 async def check_if_off_topic(user_message: str, subject: str, materials_context: str = "") -> Dict:
+    """
+    Проверяет, не уходит ли студент от темы: сначала локально по эмбеддингам,
+    и только для неоднозначных сообщений - через LLM
+
+    Returns:
+        dict: {"is_off_topic": bool, "redirect_message": Optional[str]}
+    """
+    local_result = await local_off_topic_check(user_message, subject)
+    if local_result is not None:
+        decision = "off_topic" if local_result["is_off_topic"] else "on_topic"
+        _record_off_topic_decision(subject, decision)
+        return local_result
+
+    _record_off_topic_decision(subject, "escalated")
+    return await check_if_off_topic_llm(user_message, subject, materials_context)
+
+
+async def check_if_off_topic_llm(user_message: str, subject: str, materials_context: str = "") -> Dict:
     system_prompt = f"""Ты - помощник, который проверяет, не уходит ли студент от темы учебы.
 
 Предмет: {subject}
@@ -28,8 +112,9 @@ async def check_if_off_topic(user_message: str, subject: str, materials_context:
 
 Определи, уходит ли студент от темы предмета "{subject}"."""
 
-    response = Settings.client.chat.completions.create(
-        model="gpt-4o-mini",
+    route = choose_route("off_topic_check", message=user_message)
+    response = await routed_completion(
+        route,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -48,7 +133,9 @@ async def generate_teacher_response(
     subject: str,
     teacher_description: str,
     context_history: List[Dict],
-    materials_context: str = ""
+    materials_context: str = "",
+    is_off_topic: bool = False,
+    history_summary: str = ""
 ) -> str:
     """
     Генерирует ответ преподавателя для подготовки к экзамену
@@ -56,12 +143,8 @@ async def generate_teacher_response(
     Returns:
         str: Ответ преподавателя с эмоциями и реалистичной речью
     """
-    # Формируем историю диалога
-    history_text = ""
-    for msg in context_history[-10:]:  # Берем последние 10 сообщений
-        role = msg.get("role", "user")
-        content = msg.get("content", "")
-        history_text += f"{role}: {content}\n"
+    # Формируем историю диалога: краткое содержание + свежее окно
+    history_text = format_history(context_history, history_summary)
 
     system_prompt = f"""Ты - преподаватель {teacher_name}, который помогает студенту подготовиться к экзамену по предмету "{subject}".
 
@@ -92,8 +175,10 @@ async def generate_teacher_response(
 
 Ответь как преподаватель, помогая студенту подготовиться к экзамену."""
 
-    response = Settings.client.chat.completions.create(
-        model="gpt-4o",
+    route = choose_route("teacher_response", message=student_message,
+                         context=materials_context[:2000] + history_text, is_off_topic=is_off_topic)
+    response = await routed_completion(
+        route,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
@@ -0,0 +1,107 @@
+import re
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.models import TeacherGender
+from main.cache import LRUCache
+
+
+# In-memory LRU перед таблицей teacher_genders
+gender_cache = LRUCache(maxsize=2048)
+
+MALE_PATRONYMIC_SUFFIXES = ("ович", "евич", "ьич", "ич")
+FEMALE_PATRONYMIC_SUFFIXES = ("овна", "евна", "ична")
+MALE_SURNAME_SUFFIXES = ("ов", "ев", "ёв", "ин", "ын", "ский", "цкий", "ской")
+FEMALE_SURNAME_SUFFIXES = ("ова", "ева", "ёва", "ина", "ына", "ская", "цкая")
+
+# Мужские имена, оканчивающиеся на "а", "я" или "ь"
+MALE_NAME_EXCEPTIONS = {
+    "никита", "илья", "кузьма", "фома", "лука", "савва", "данила",
+    "гаврила", "игорь", "лазарь", "миша", "паша", "дима",
+    "вова", "ваня", "петя", "коля", "серёжа", "сережа", "лёша", "леша"
+}
+# Уменьшительные имена, общие для мужчин и женщин: пол решает только фамилия
+UNISEX_NAMES = {"саша", "саня", "шура", "женя", "валя", "слава"}
+# Женские имена без окончаний "а", "я", "ь"
+FEMALE_NAME_EXCEPTIONS = {"любовь", "нинель", "руфь", "эсфирь"}
+
+_CYRILLIC_WORD = re.compile(r"^[а-яё-]+$")
+
+
+def normalize_teacher_name(teacher_name: str) -> str:
+    """Нормализует имя для использования в качестве ключа кэша"""
+    return " ".join((teacher_name or "").lower().split())
+
+
+def _vote_by_suffixes(words, male_suffixes, female_suffixes) -> Optional[str]:
+    votes = set()
+    for word in words:
+        if word.endswith(female_suffixes):
+            votes.add("female")
+        elif word.endswith(male_suffixes):
+            votes.add("male")
+    return votes.pop() if len(votes) == 1 else None
+
+
+def detect_gender_by_rules(teacher_name: str) -> Optional[str]:
+    """
+    Определяет пол по правилам для русских имен: отчество, окончание фамилии,
+    окончание имени
+
+    Args:
+        teacher_name: Имя преподавателя
+
+    Returns:
+        Optional[str]: "male", "female" или None, если правила не сработали
+    """
+    words = [w.strip(".,") for w in normalize_teacher_name(teacher_name).split()]
+    words = [w for w in words if len(w) > 2 and _CYRILLIC_WORD.match(w)]
+    if not words:
+        return None
+
+    # Отчество дает самый надежный сигнал
+    gender = _vote_by_suffixes(
+        words, MALE_PATRONYMIC_SUFFIXES, FEMALE_PATRONYMIC_SUFFIXES)
+    if gender:
+        return gender
+
+    # Имя
+    first_name = words[0]
+    if first_name in MALE_NAME_EXCEPTIONS:
+        return "male"
+    if first_name in FEMALE_NAME_EXCEPTIONS:
+        return "female"
+
+    # Фамилия
+    gender = _vote_by_suffixes(
+        words, MALE_SURNAME_SUFFIXES, FEMALE_SURNAME_SUFFIXES)
+    if gender:
+        return gender
+
+    if first_name in UNISEX_NAMES:
+        return None
+    if first_name[-1] in ("а", "я"):
+        return "female"
+    if first_name[-1] not in ("ь", "о", "е", "и", "у", "ы", "э", "ю"):
+        return "male"
+    return None
+
+
+async def get_stored_gender(db: AsyncSession, teacher_name: str) -> Optional[str]:
+    """Ищет пол преподавателя в таблице teacher_genders"""
+    result = await db.execute(
+        select(TeacherGender.gender).where(
+            TeacherGender.name == normalize_teacher_name(teacher_name))
+    )
+    return result.scalar_one_or_none()
+
+
+async def store_gender(db: AsyncSession, teacher_name: str, gender: str, source: str = "llm"):
+    """Сохраняет пол преподавателя в таблицу teacher_genders"""
+    await db.execute(
+        insert(TeacherGender)
+        .values(name=normalize_teacher_name(teacher_name), gender=gender, source=source)
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    await db.commit()
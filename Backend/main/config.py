@@ -1,8 +1,11 @@
 import os
+import json
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import boto3
+from botocore.config import Config as BotoConfig
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 
@@ -18,19 +21,153 @@ class Settings:
     S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
     S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
     client = OpenAI(api_key=os.getenv("OPENAI_TOKEN"))
+    # Повторы делает exam.llm_gateway, поэтому встроенные в клиент отключены
+    async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_TOKEN"), max_retries=0)
     _origins_str = os.getenv("ORIGINS") or "http://localhost:3000,http://localhost:8000"
     ORIGINS = [origin.strip() for origin in _origins_str.split(",") if origin.strip()]
+    # Токен для GET /metrics (Authorization: Bearer); не задан - эндпоинт выключен
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
     SECRET_KEY = os.getenv("SECRET_KEY")
     ALGORITHM = os.getenv("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
     REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"))
+    # Ключ HMAC для хранения refresh-токенов (по умолчанию SECRET_KEY)
+    REFRESH_TOKEN_PEPPER = os.getenv("REFRESH_TOKEN_PEPPER") or SECRET_KEY
+    # Поиск среди старых bcrypt-хэшей (токены, выданные до перехода на HMAC) стоит O(N)
+    # проверок bcrypt на каждый неизвестный токен, поэтому работает только на время
+    # выката: до указанной даты (ISO 8601). По умолчанию - REFRESH_TOKEN_EXPIRE_DAYS
+    # с момента запуска, к этому времени все старые токены истекут; "off" - выключен.
+    _legacy_fallback_until = os.getenv("REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL")
+    if _legacy_fallback_until == "off":
+        REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL = None
+    elif _legacy_fallback_until:
+        REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL = datetime.fromisoformat(_legacy_fallback_until)
+    else:
+        REFRESH_TOKEN_LEGACY_FALLBACK_UNTIL = datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    # Кэш пользователя в get_current_user (секунды жизни записи и размер)
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL") or 30)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE") or 10000)
+    # Размер пула потоков для bcrypt (по умолчанию - число ядер)
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or os.cpu_count() or 2)
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
     DATABASE_URL = os.getenv("DATABASE_URL")
+    # Реплика для read-only эндпоинтов и окно read-your-writes после записи (секунды)
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+    READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS") or 5)
+
+    # Профиль подключения к БД
+    DB_ECHO = (os.getenv("DB_ECHO") or "false").lower() == "true"
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 10)
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW") or 20)
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 30)
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE") or 1800)
+    DB_POOL_PRE_PING = (os.getenv("DB_POOL_PRE_PING") or "true").lower() == "true"
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE") or 100)
+    # Режим совместимости с PgBouncer (transaction pooling)
+    DB_PGBOUNCER = (os.getenv("DB_PGBOUNCER") or "false").lower() == "true"
+
+    # Фоновое обслуживание БД
+    MAINTENANCE_ENABLED = (os.getenv("MAINTENANCE_ENABLED") or "true").lower() == "true"
+    MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS") or 3600)
+    MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE") or 1000)
+    STALE_EXAM_SESSION_HOURS = float(os.getenv("STALE_EXAM_SESSION_HOURS") or 24)
+
+    # Локальный фильтр "не по теме" на эмбеддингах: ниже LOW - точно не по теме,
+    # выше HIGH - точно по теме, между ними - эскалация в LLM
+    OFF_TOPIC_GATE_ENABLED = (os.getenv("OFF_TOPIC_GATE_ENABLED") or "true").lower() == "true"
+    OFF_TOPIC_GATE_MODE = os.getenv("OFF_TOPIC_GATE_MODE") or "top_k"  # top_k, centroid
+    OFF_TOPIC_TOP_K = int(os.getenv("OFF_TOPIC_TOP_K") or 3)
+    OFF_TOPIC_LOW_THRESHOLD = float(os.getenv("OFF_TOPIC_LOW_THRESHOLD") or 0.2)
+    OFF_TOPIC_HIGH_THRESHOLD = float(os.getenv("OFF_TOPIC_HIGH_THRESHOLD") or 0.4)
+    # JSON вида {"Физика": [0.25, 0.45]}
+    OFF_TOPIC_SUBJECT_THRESHOLDS = json.loads(os.getenv("OFF_TOPIC_SUBJECT_THRESHOLDS") or "{}")
+
+    # Шлюз LLM: лимиты квоты OpenAI, параллелизм, повторы и circuit breaker
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE") or 500)
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE") or 200000)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY") or 16)
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES") or 3)
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY") or 0.5)
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY") or 20)
+    LLM_DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS") or 500)
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD") or 5)
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS") or 30)
+    # Доли слотов и квоты, зарезервированные за interactive (экзамен, подготовка)
+    # и bulk (загрузка материалов) вызовами
+    LLM_INTERACTIVE_RESERVED_SHARE = float(os.getenv("LLM_INTERACTIVE_RESERVED_SHARE") or 0.5)
+    LLM_BULK_RESERVED_SHARE = float(os.getenv("LLM_BULK_RESERVED_SHARE") or 0.1)
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE") or 64)
+
+    # Маршрутизация моделей: короткие уточнения - маленькая модель, сложные - большая
+    LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL") or "gpt-4o-mini"
+    LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL") or "gpt-4o"
+    ROUTER_SHORT_MESSAGE_CHARS = int(os.getenv("ROUTER_SHORT_MESSAGE_CHARS") or 120)
+    ROUTER_LONG_MESSAGE_CHARS = int(os.getenv("ROUTER_LONG_MESSAGE_CHARS") or 600)
+    ROUTER_LARGE_CONTEXT_CHARS = int(os.getenv("ROUTER_LARGE_CONTEXT_CHARS") or 16000)
+
+    # Свертка истории сессии: после порога старые ходы сворачиваются в краткое содержание
+    HISTORY_COMPACT_THRESHOLD_TOKENS = int(os.getenv("HISTORY_COMPACT_THRESHOLD_TOKENS") or 2000)
+    HISTORY_WINDOW_TOKENS = int(os.getenv("HISTORY_WINDOW_TOKENS") or 800)
+    HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS") or 300)
+    # Предел числа реплик, читаемых из журнала диалога за ход
+    HISTORY_MAX_TAIL_TURNS = int(os.getenv("HISTORY_MAX_TAIL_TURNS") or 200)
+    # Размер порции серверного курсора при выгрузке истории
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE") or 500)
+
+    # Банк вопросов, генерируемый при загрузке материалов
+    QUESTION_BANK_ENABLED = (os.getenv("QUESTION_BANK_ENABLED") or "true").lower() == "true"
+    QUESTION_BANK_REPHRASE = (os.getenv("QUESTION_BANK_REPHRASE") or "false").lower() == "true"
+    QUESTION_BANK_CLUSTER_SIZE = int(os.getenv("QUESTION_BANK_CLUSTER_SIZE") or 3)
+    QUESTION_BANK_QUESTIONS_PER_CLUSTER = int(os.getenv("QUESTION_BANK_QUESTIONS_PER_CLUSTER") or 3)
+
+    # Размер локального индекса кэша синтеза речи
+    TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE") or 4096)
+
+    # Клиент SpeechKit
+    SPEECHKIT_URL = os.getenv("SPEECHKIT_URL") or "https://tts.api.cloud.yandex.net/speech/v1/tts:synthesize"
+    SPEECHKIT_MAX_CONNECTIONS = int(os.getenv("SPEECHKIT_MAX_CONNECTIONS") or 20)
+    SPEECHKIT_MAX_CONCURRENCY = int(os.getenv("SPEECHKIT_MAX_CONCURRENCY") or 10)
+    SPEECHKIT_TIMEOUT = float(os.getenv("SPEECHKIT_TIMEOUT") or 30)
+    SPEECHKIT_MAX_RETRIES = int(os.getenv("SPEECHKIT_MAX_RETRIES") or 3)
+    SPEECHKIT_RETRY_BASE_DELAY = float(os.getenv("SPEECHKIT_RETRY_BASE_DELAY") or 0.5)
+
+    # Длинные реплики синтезируются параллельно по предложениям
+    TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS") or 250)
+    TTS_MAX_PARALLEL_CHUNKS = int(os.getenv("TTS_MAX_PARALLEL_CHUNKS") or 4)
+
+    # Клиент Deepgram
+    DEEPGRAM_MAX_CONNECTIONS = int(os.getenv("DEEPGRAM_MAX_CONNECTIONS") or 20)
+    DEEPGRAM_MAX_CONCURRENCY = int(os.getenv("DEEPGRAM_MAX_CONCURRENCY") or 10)
+    DEEPGRAM_TIMEOUT = float(os.getenv("DEEPGRAM_TIMEOUT") or 60)
+    DEEPGRAM_MAX_RETRIES = int(os.getenv("DEEPGRAM_MAX_RETRIES") or 2)
+    DEEPGRAM_RETRY_BASE_DELAY = float(os.getenv("DEEPGRAM_RETRY_BASE_DELAY") or 0.5)
+
+    # Хранилище S3: повторы делает main.storage, поэтому встроенные в клиент отключены
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS") or 50)
+    S3_TIMEOUT = float(os.getenv("S3_TIMEOUT") or 30)
+    S3_MAX_RETRIES = int(os.getenv("S3_MAX_RETRIES") or 3)
+    S3_RETRY_BASE_DELAY = float(os.getenv("S3_RETRY_BASE_DELAY") or 0.5)
+    S3_MULTIPART_PART_SIZE = int(os.getenv("S3_MULTIPART_PART_SIZE") or 8 * 1024 * 1024)
+
+    # Прямая загрузка клиентом в S3 по presigned POST
+    PRESIGNED_UPLOAD_EXPIRES = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES") or 300)
+    PRESIGNED_DOWNLOAD_EXPIRES = int(os.getenv("PRESIGNED_DOWNLOAD_EXPIRES") or 600)
+    ANSWER_AUDIO_MAX_BYTES = int(os.getenv("ANSWER_AUDIO_MAX_BYTES") or 25 * 1024 * 1024)
+    # Предельная длительность потокового ответа по WebSocket (секунды)
+    STREAM_ANSWER_MAX_SECONDS = float(os.getenv("STREAM_ANSWER_MAX_SECONDS") or 300)
+    MATERIAL_PDF_MAX_BYTES = int(os.getenv("MATERIAL_PDF_MAX_BYTES") or 100 * 1024 * 1024)
 
     S3_CLIENT = boto3.client(
         "s3",
         endpoint_url=S3_ENDPOINT,
         aws_access_key_id=S3_ACCESS_KEY,
         aws_secret_access_key=S3_SECRET_KEY,
+        config=BotoConfig(
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+            connect_timeout=5,
+            read_timeout=S3_TIMEOUT,
+            tcp_keepalive=True,
+            retries={"total_max_attempts": 1}
+        )
     )
@@ -1,38 +1,72 @@
-from sqlalchemy import select
-from exam.deepgram import transcribe_audio
-from exam.speechkit import text_to_speech_url
+from sqlalchemy import select, func, tuple_
+from exam.deepgram import transcribe_audio, transcribe_audio_bytes, transcriber
+from exam.speechkit import text_to_speech_url, speechkit_client, save_audio_to_s3
 from exam.openai_service import generate_first_question, analyze_answer, generate_next_question, get_emotion_voice_mapping, get_emotion_emotion_mapping, detect_teacher_gender
-from exam.rag import build_rag_context, get_subject_materials, save_pdf_to_qdrant
+from exam.rag import build_rag_context, get_subject_materials, save_pdf_to_qdrant, ingest_pdf_from_storage
 from exam.pdf_parser import parse_pdf_from_file, parse_pdf_from_url
 from exam.study_service import generate_teacher_response, check_if_off_topic
+from exam.llm_gateway import LLMUnavailableError
+from exam.history import append_turns, load_history, compact_history
+from exam.question_bank import get_bank_question, build_question_bank, mark_question_used
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from main.config import Settings
+from main.metrics import metrics, StageTimer
+from main.storage import storage
+from main.pagination import encode_cursor, decode_cursor
+from main.maintenance import maintenance_loop
+from main.uploads import create_presigned_upload, verify_upload
 from main.schemas import (
     VideoRequestDto, CutVideoRequestDto, AudioRequestDto, UserCreate, Token,
     RefreshTokenRequest, UserResponse, SubscriptionUpdate, UserLogin,
     ExamStartRequest, QuestionResponse, AnswerRequest, AnswerResponse, ExamStatusResponse,
     StudyStartRequest, StudyMessageRequest, StudyResponse, StudyMessageResponse,
-    PDFUploadResponse
+    PDFUploadResponse, UploadPresignRequest, UploadPresignResponse, AnswerUploadCompleteRequest,
+    MaterialUploadCompleteRequest, MaterialUploadCompleteResponse
 )
-from typing import List
+from typing import Awaitable, List, Optional
+from contextlib import asynccontextmanager
 from botocore.exceptions import NoCredentialsError, ClientError
 from pydantic import HttpUrl
 import aiofiles
-from fastapi import FastAPI, Depends, HTTPException, status, Path, UploadFile, File, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, status, Path, UploadFile, File, Form, Request, BackgroundTasks, Response, WebSocket, WebSocketDisconnect, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 import uvicorn
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordRequestForm
-from auth.dependencies import get_db, get_current_user
+from auth.database import count_statements, read_session_factory, end_read_transaction
+from auth.dependencies import get_db, get_read_db, client_key, remember_writer, get_current_user, get_user_from_token, invalidate_cached_user
 from auth.models import User, ExamSession, ExamQuestion, ExamAnswer, StudySession, StudyMessage
 from auth.auth import authenticate_user, create_access_token, save_refresh_token, get_refresh_token, revoke_refresh_token, \
-    create_refresh_token, get_password_hash, get_user_by_email, get_user_by_name
+    create_refresh_token, get_password_hash, get_user_by_email, get_user_by_name, shutdown_hashing_pool
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
+import os
+import hmac
 import uuid
+import json
+import time
+import asyncio
 
-app = FastAPI(title="Video Translation Platform")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Клиент Deepgram создается один раз при старте
+    try:
+        transcriber.start()
+    except ValueError as e:
+        print(f"⚠️  Warning: Deepgram client is not initialized: {e}")
+    # Периодическая очистка refresh_tokens и брошенных экзаменов
+    maintenance_task = asyncio.create_task(maintenance_loop()) if Settings.MAINTENANCE_ENABLED else None
+    yield
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    # Закрываем долгоживущие HTTP-клиенты
+    await speechkit_client.aclose()
+    await transcriber.aclose()
+    shutdown_hashing_pool()
+
+
+app = FastAPI(title="Video Translation Platform", lifespan=lifespan)
 
 origins = Settings.ORIGINS
 print(f"🌐 CORS Origins configured: {origins}")  # Debug log
@@ -43,9 +77,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы (GET /study/{id}/messages) должен быть доступен из браузера
+    expose_headers=["X-Next-Cursor"],
 )
 
 
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI service is temporarily unavailable, please retry"},
+        headers={"Retry-After": str(int(Settings.LLM_CIRCUIT_RESET_SECONDS))}
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    # В метриках есть названия предметов и внутренние показатели - только по токену
+    if not Settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (request.headers.get("authorization") or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token, Settings.METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return metrics.render_prometheus()
+
+
 @app.post("/upload-from-url")
 async def upload_from_url(video_url: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     return await upload_video_from_url(video_url)
@@ -54,29 +110,26 @@ async def upload_from_url(video_url: str, current_user: User = Depends(get_curre
 @app.post("/upload")
 async def upload(file: UploadFile = File(...), current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     try:
-        file_content = await file.read()
         final_filename = f'{str(uuid.uuid4())}_{file.filename}'
-        last_err = None
-        for attempt in range(3):
-            try:
-                Settings.S3_CLIENT.put_object(
-                    Bucket=Settings.S3_BUCKET,
-                    Key=final_filename,
-                    Body=file_content,
-                    ContentType=file.content_type,
-                )
-                break
-            except Exception as e:
-                last_err = str(e)
-                import time
-                time.sleep(1 * (attempt + 1))
-
-        file_url = f"{Settings.S3_ENDPOINT}/{Settings.S3_BUCKET}/{final_filename}"
+        # Starlette уже сохранил файл во временный файл (в памяти до 1 МБ, дальше на
+        # диске) - читаем его частями и загружаем multipart-загрузкой
+        file_url = await storage.upload_stream(final_filename, file.read, file.content_type)
         return {"url": file_url}
     except (NoCredentialsError, ClientError) as e:
         raise HTTPException(status_code=500, detail=f"S3 error: {str(e)}")
 
 
+@app.post("/uploads/presign", response_model=UploadPresignResponse)
+async def presign_upload(request: UploadPresignRequest, current_user: User = Depends(get_current_user)):
+    """
+    Выдает presigned POST для загрузки файла напрямую в S3 (в обход API).
+    После загрузки клиент вызывает соответствующий /complete эндпоинт.
+    """
+    try:
+        return create_presigned_upload(current_user.id, request.purpose, request.content_type, request.size)
+    except (NoCredentialsError, ClientError) as e:
+        raise HTTPException(status_code=500, detail=f"S3 error: {str(e)}")
+
 
 @app.post("/register", response_model=UserResponse)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
@@ -84,10 +137,11 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     if existing_user:
         raise HTTPException(
             status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     new_user = User(email=user.email, username=user.username,
                     hashed_password=hashed_password)
     db.add(new_user)
+    remember_writer(db, new_user.email)
     await db.commit()
     await db.refresh(new_user)
     return new_user
@@ -99,6 +153,7 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect credentials")
+    remember_writer(db, user.email)
     access_token = create_access_token(data={"email": user.email}, expires_delta=timedelta(
         minutes=Settings.ACCESS_TOKEN_EXPIRE_MINUTES))
     refresh_token = create_refresh_token()
@@ -178,6 +233,7 @@ async def update_sub(user_id: int = Path(...), update: SubscriptionUpdate = None
     user = await db.get(User, user_id)
     user.subscription_level = update.new_level
     await db.commit()
+    invalidate_cached_user(user.email)
     return {"new_level": user.subscription_level}
 
 
@@ -194,18 +250,25 @@ async def start_exam(
     Запускает экзамен для студента
     """
     # Определяем пол преподавателя
-    teacher_gender = await detect_teacher_gender(request.teacher_name)
+    teacher_gender = await detect_teacher_gender(request.teacher_name, db)
 
     # Строим RAG контекст из материалов
     materials_context = await build_rag_context(db, request.subject, request.materials)
 
-    # Генерируем первый вопрос с помощью OpenAI
-    question_data = await generate_first_question(
-        request.teacher_name,
+    # Берем первый вопрос из банка, если он пуст - генерируем с помощью OpenAI
+    question_data = await get_bank_question(
+        db,
         request.subject,
-        request.teacher_description,
-        materials_context
+        request.teacher_name,
+        request.teacher_description
     )
+    if question_data is None:
+        question_data = await generate_first_question(
+            request.teacher_name,
+            request.subject,
+            request.teacher_description,
+            materials_context
+        )
 
     # Создаем сессию экзамена
     exam_session = ExamSession(
@@ -213,11 +276,7 @@ async def start_exam(
         teacher_name=request.teacher_name,
         subject=request.subject,
         teacher_description=request.teacher_description,
-        teacher_gender=teacher_gender,
-        context_history=[
-            {"role": "system", "content": f"Преподаватель: {request.teacher_name}, Предмет: {request.subject}"},
-            {"role": "assistant", "content": question_data["question"]}
-        ]
+        teacher_gender=teacher_gender
     )
     db.add(exam_session)
     await db.commit()
@@ -237,9 +296,15 @@ async def start_exam(
         question_index=0,
         question_text=question_text,
         question_audio_url=question_audio_url,
-        is_follow_up=False
+        is_follow_up=False,
+        bank_question_id=question_data.get("bank_question_id")
     )
     db.add(exam_question)
+    append_turns(db, exam_session, [
+        {"role": "system", "content": f"Преподаватель: {request.teacher_name}, Предмет: {request.subject}"},
+        {"role": "assistant", "content": question_text}
+    ])
+    await mark_question_used(db, question_data.get("bank_question_id"))
     await db.commit()
     await db.refresh(exam_question)
 
@@ -253,17 +318,12 @@ async def start_exam(
     )
 
 
-@app.post("/exam/answer", response_model=AnswerResponse)
-async def submit_answer(
-    request: AnswerRequest,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
+async def get_exam_turn(db: AsyncSession, current_user: User, exam_session_id: int, question_id: int):
     """
-    Обрабатывает ответ студента на вопрос
+    Получает сессию экзамена и вопрос, проверяя права и статус сессии
     """
     # Получаем сессию экзамена
-    exam_session = await db.get(ExamSession, request.exam_session_id)
+    exam_session = await db.get(ExamSession, exam_session_id)
     if not exam_session:
         raise HTTPException(status_code=404, detail="Exam session not found")
 
@@ -275,41 +335,67 @@ async def submit_answer(
             status_code=400, detail="Exam session is not in progress")
 
     # Получаем вопрос
-    question = await db.get(ExamQuestion, request.question_id)
+    question = await db.get(ExamQuestion, question_id)
     if not question or question.exam_session_id != exam_session.id:
         raise HTTPException(status_code=404, detail="Question not found")
 
-    # Транскрибируем аудио ответа
-    transcribed_text = await transcribe_audio(request.answer_audio_url)
+    return exam_session, question
 
-    # Сохраняем ответ
-    exam_answer = ExamAnswer(
-        question_id=question.id,
-        answer_audio_url=request.answer_audio_url,
-        transcribed_text=transcribed_text
-    )
-    db.add(exam_answer)
-    await db.commit()
+
+# Число SQL-запросов на ход экзамена (гистограмма)
+DB_STATEMENT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+
+
+async def process_exam_answer(
+    db: AsyncSession,
+    exam_session: ExamSession,
+    question: ExamQuestion,
+    transcribed_text: str,
+    answer_audio_url: Optional[str],
+    turn_timer: StageTimer,
+    audio_archive: Optional[Awaitable[Optional[str]]] = None
+) -> AnswerResponse:
+    """
+    Оценивает транскрибированный ответ студента и готовит следующий вопрос.
+
+    Если передан audio_archive (архивация аудио, идущая параллельно с оценкой),
+    ссылка на аудио берется из его результата: при неудачной архивации ответ
+    сохраняется без ссылки.
+
+    Сначала выполняются чтения (история, материалы), после чего транзакция
+    закрывается: внешние вызовы (LLM, синтез речи) идут без открытой транзакции.
+    Изменения сессии копятся в памяти и сохраняются одной транзакцией
+    с единственным commit в конце хода.
+    """
+    db_statements = count_statements()
+
+    history = await load_history(db, exam_session)
 
     # Получаем материалы для контекста
-    from exam.rag import get_subject_materials
-    materials_context = await get_subject_materials(db, exam_session.subject)
+    async with turn_timer.stage("retrieval"):
+        materials_context = await get_subject_materials(db, exam_session.subject)
+    # Чтения закончены - не держим транзакцию во время вызовов LLM и TTS
+    await end_read_transaction(db)
 
     # Проверяем, не уходит ли студент от темы
-    off_topic_check =await check_if_off_topic(
-        transcribed_text, exam_session.subject, materials_context)
+    async with turn_timer.stage("off_topic"):
+        off_topic_check = await check_if_off_topic(
+            transcribed_text, exam_session.subject, materials_context)
 
     # Анализируем ответ с помощью OpenAI
-    analysis = await analyze_answer(
-        question.question_text,
-        transcribed_text,
-        exam_session.teacher_name,
-        exam_session.subject,
-        exam_session.teacher_description,
-        exam_session.teacher_mood,
-        exam_session.context_history or [],
-        materials_context
-    )
+    async with turn_timer.stage("analysis"):
+        analysis = await analyze_answer(
+            question.question_text,
+            transcribed_text,
+            exam_session.teacher_name,
+            exam_session.subject,
+            exam_session.teacher_description,
+            exam_session.teacher_mood,
+            history,
+            materials_context,
+            is_off_topic=bool(off_topic_check.get("is_off_topic")),
+            history_summary=exam_session.history_summary or ""
+        )
 
     # Если студент уходит от темы, используем redirect_message
     if off_topic_check.get("is_off_topic") or analysis.get("is_off_topic"):
@@ -320,92 +406,104 @@ async def submit_answer(
         # Не задаем новый вопрос, просто возвращаем к теме
         analysis["followup_question"] = None
 
-    # Обновляем ответ
-    exam_answer.is_correct = analysis["is_correct"]
-    exam_answer.ai_feedback = analysis["feedback"]
-    exam_answer.teacher_mood_after = analysis["teacher_mood"]
-
-    # Обновляем сессию
-    exam_session.teacher_mood = analysis["teacher_mood"]
-    exam_session.context_history = (exam_session.context_history or []) + [
-        {"role": "user", "content": f"Студент: {transcribed_text}"},
-        {"role": "assistant", "content": analysis["feedback"]}
-    ]
-
-    next_question = None
+    # Сессию меняем только на этапе сохранения: выборка из банка закрывает свою
+    # транзакцию commit'ом, и изменения не должны записаться раньше времени
+    teacher_mood = analysis["teacher_mood"]
     exam_completed = analysis.get("exam_completed", False)
 
+    next_question_text = None
+    is_follow_up = False
+    bank_question_id = None
+
     # Если нужен дополнительный вопрос или следующий вопрос
     if analysis.get("should_ask_followup") and analysis.get("followup_question"):
-        # Создаем follow-up вопрос
-        followup_text = analysis["followup_question"]
-        followup_audio_url = await text_to_speech_url(
-            followup_text,
-            voice=get_emotion_voice_mapping(
-                exam_session.teacher_mood, exam_session.teacher_gender),
-            emotion=get_emotion_emotion_mapping(exam_session.teacher_mood)
-        )
-
-        followup_question = ExamQuestion(
-            exam_session_id=exam_session.id,
-            question_index=exam_session.current_question_index + 1,
-            question_text=followup_text,
-            question_audio_url=followup_audio_url,
-            is_follow_up=True
-        )
-        db.add(followup_question)
-        await db.commit()
-        await db.refresh(followup_question)
-
-        exam_session.current_question_index += 1
-        exam_session.context_history.append(
-            {"role": "assistant", "content": followup_text}
-        )
-
-        next_question = QuestionResponse(
-            exam_session_id=exam_session.id,
-            question_id=followup_question.id,
-            question_text=followup_question.question_text,
-            question_audio_url=followup_question.question_audio_url,
-            question_index=followup_question.question_index,
-            is_follow_up=followup_question.is_follow_up
-        )
+        next_question_text = analysis["followup_question"]
+        is_follow_up = True
     elif not exam_completed:
-        # Генерируем следующий основной вопрос
-        next_question_data = await generate_next_question(
-            exam_session.teacher_name,
+        # Берем следующий основной вопрос из банка, если он исчерпан - генерируем
+        next_question_data = await get_bank_question(
+            db,
             exam_session.subject,
+            exam_session.teacher_name,
             exam_session.teacher_description,
-            exam_session.teacher_mood,
-            exam_session.context_history or [],
-            materials_context,
-            exam_session.current_question_index + 1
+            teacher_mood,
+            exam_session.id
         )
-
+        if next_question_data is None:
+            next_question_data = await generate_next_question(
+                exam_session.teacher_name,
+                exam_session.subject,
+                exam_session.teacher_description,
+                teacher_mood,
+                history,
+                materials_context,
+                exam_session.current_question_index + 1,
+                history_summary=exam_session.history_summary or ""
+            )
         next_question_text = next_question_data["question"]
+        bank_question_id = next_question_data.get("bank_question_id")
+
+    next_question_audio_url = None
+    if next_question_text:
         next_question_audio_url = await text_to_speech_url(
             next_question_text,
-            voice=get_emotion_voice_mapping(
-                exam_session.teacher_mood, exam_session.teacher_gender),
-            emotion=get_emotion_emotion_mapping(exam_session.teacher_mood)
+            voice=get_emotion_voice_mapping(teacher_mood, exam_session.teacher_gender),
+            emotion=get_emotion_emotion_mapping(teacher_mood)
         )
 
-        next_exam_question = ExamQuestion(
-            exam_session_id=exam_session.id,
-            question_index=exam_session.current_question_index + 1,
-            question_text=next_question_text,
-            question_audio_url=next_question_audio_url,
-            is_follow_up=False
+    # Обновляем историю диалога
+    turn_history = [
+        {"role": "user", "content": f"Студент: {transcribed_text}"},
+        {"role": "assistant", "content": analysis["feedback"]}
+    ]
+    if next_question_text:
+        turn_history.append({"role": "assistant", "content": next_question_text})
+
+    # Если экзамен завершен
+    if exam_completed:
+        exam_session.status = "completed"
+        exam_session.completed_at = datetime.now()
+
+    # Сворачиваем старые ходы в краткое содержание, чтобы промпт не рос
+    await compact_history(exam_session, history + turn_history)
+
+    if audio_archive is not None:
+        answer_audio_url = await audio_archive
+
+    # Сохраняем ход одной транзакцией: ID ответа и вопроса выдаются при flush внутри commit
+    async with turn_timer.stage("persist"):
+        exam_answer = ExamAnswer(
+            question_id=question.id,
+            answer_audio_url=answer_audio_url,
+            transcribed_text=transcribed_text,
+            is_correct=analysis["is_correct"],
+            ai_feedback=analysis["feedback"],
+            teacher_mood_after=analysis["teacher_mood"]
         )
-        db.add(next_exam_question)
+        db.add(exam_answer)
+        append_turns(db, exam_session, turn_history)
+        exam_session.teacher_mood = teacher_mood
+
+        next_exam_question = None
+        if next_question_text:
+            exam_session.current_question_index += 1
+            next_exam_question = ExamQuestion(
+                exam_session_id=exam_session.id,
+                question_index=exam_session.current_question_index,
+                question_text=next_question_text,
+                question_audio_url=next_question_audio_url,
+                is_follow_up=is_follow_up,
+                bank_question_id=bank_question_id
+            )
+            db.add(next_exam_question)
+            await mark_question_used(db, bank_question_id)
+
         await db.commit()
-        await db.refresh(next_exam_question)
 
-        exam_session.current_question_index += 1
-        exam_session.context_history.append(
-            {"role": "assistant", "content": next_question_text}
-        )
+    metrics.observe("exam_turn_db_statements", db_statements.count, buckets=DB_STATEMENT_BUCKETS)
 
+    next_question = None
+    if next_exam_question is not None:
         next_question = QuestionResponse(
             exam_session_id=exam_session.id,
             question_id=next_exam_question.id,
@@ -415,14 +513,6 @@ async def submit_answer(
             is_follow_up=next_exam_question.is_follow_up
         )
 
-    # Если экзамен завершен
-    if exam_completed:
-        exam_session.status = "completed"
-        exam_session.completed_at = datetime.now()
-
-    await db.commit()
-    await db.refresh(exam_answer)
-
     return AnswerResponse(
         exam_session_id=exam_session.id,
         answer_id=exam_answer.id,
@@ -434,11 +524,289 @@ async def submit_answer(
     )
 
 
+@app.post("/exam/answer", response_model=AnswerResponse)
+async def submit_answer(
+    request: AnswerRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Обрабатывает ответ студента на вопрос
+    """
+    turn_timer = StageTimer("exam_turn")
+
+    exam_session, question = await get_exam_turn(
+        db, current_user, request.exam_session_id, request.question_id)
+    # Транскрибация - внешний вызов: не держим открытую транзакцию
+    await end_read_transaction(db)
+
+    # Транскрибируем аудио ответа
+    async with turn_timer.stage("transcription"):
+        transcribed_text = await transcribe_audio(request.answer_audio_url)
+
+    answer_response = await process_exam_answer(
+        db, exam_session, question, transcribed_text, request.answer_audio_url, turn_timer)
+
+    turn_timer.finish()
+    response.headers["Server-Timing"] = turn_timer.server_timing()
+
+    return answer_response
+
+
+@app.post("/exam/answer/upload", response_model=AnswerResponse)
+async def submit_answer_upload(
+    response: Response,
+    exam_session_id: int = Form(...),
+    question_id: int = Form(...),
+    audio: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Обрабатывает ответ студента, загруженный напрямую файлом (без предварительной
+    загрузки в S3): транскрибация и архивирование в S3 идут параллельно
+    """
+    turn_timer = StageTimer("exam_turn")
+
+    exam_session, question = await get_exam_turn(db, current_user, exam_session_id, question_id)
+    # Чтение и транскрибация - без открытой транзакции
+    await end_read_transaction(db)
+
+    # Тело больше лимита отклоняем, не читая его целиком в память
+    max_size = Settings.ANSWER_AUDIO_MAX_BYTES
+    if audio.size is not None and audio.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Audio file must not exceed {max_size} bytes"
+        )
+    audio_data = await audio.read(max_size + 1)
+    if len(audio_data) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Audio file must not exceed {max_size} bytes"
+        )
+    if not audio_data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Empty audio file"
+        )
+
+    content_type = audio.content_type or "application/octet-stream"
+    extension = os.path.splitext(audio.filename or "")[1] or ".webm"
+    answer_filename = f"answers/{uuid.uuid4()}{extension}"
+
+    # Один и тот же буфер уходит и в Deepgram, и в S3: архивация идет в фоне,
+    # а ее результат дожидается process_exam_answer перед записью ответа
+    async def archive():
+        async with turn_timer.stage("archive"):
+            return await archive_answer_audio(audio_data, answer_filename, content_type)
+
+    archive_task = asyncio.create_task(archive())
+    try:
+        try:
+            async with turn_timer.stage("transcription"):
+                transcribed_text = await transcribe_audio_bytes(audio_data)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=str(e)
+            )
+
+        answer_response = await process_exam_answer(
+            db, exam_session, question, transcribed_text, None, turn_timer, audio_archive=archive_task)
+    except BaseException:
+        # Ответ не сохранен - аудио в архиве никому не нужно
+        await discard_answer_audio(archive_task, answer_filename)
+        raise
+
+    turn_timer.finish()
+    response.headers["Server-Timing"] = turn_timer.server_timing()
+
+    return answer_response
+
+
+@app.post("/exam/answer/complete", response_model=AnswerResponse)
+async def complete_answer_upload(
+    request: AnswerUploadCompleteRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Обрабатывает ответ, загруженный клиентом напрямую в S3 по presigned POST:
+    Deepgram забирает аудио из S3 сам, через API байты не проходят
+    """
+    turn_timer = StageTimer("exam_turn")
+
+    exam_session, question = await get_exam_turn(
+        db, current_user, request.exam_session_id, request.question_id)
+    # Проверка в S3 и транскрибация - без открытой транзакции
+    await end_read_transaction(db)
+    await verify_upload(current_user.id, "answer_audio", request.key)
+
+    async with turn_timer.stage("transcription"):
+        transcribed_text = await transcribe_audio(
+            storage.presigned_get(request.key, Settings.PRESIGNED_DOWNLOAD_EXPIRES))
+
+    answer_response = await process_exam_answer(
+        db, exam_session, question, transcribed_text, storage.url(request.key), turn_timer)
+
+    turn_timer.finish()
+    response.headers["Server-Timing"] = turn_timer.server_timing()
+
+    return answer_response
+
+
+def is_stop_message(text: str) -> bool:
+    """Управляющее сообщение {"type": "stop"}; прочий (в т.ч. не JSON) текст игнорируется"""
+    try:
+        control = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(control, dict) and control.get("type") == "stop"
+
+
+async def close_websocket_with_error(websocket: WebSocket, detail: str, code: int):
+    """Сообщает клиенту об ошибке и закрывает соединение (если оно еще открыто)"""
+    try:
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=code)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+async def archive_answer_audio(audio: bytes, filename: str, content_type: str) -> Optional[str]:
+    """
+    Сохраняет аудио ответа в S3
+
+    Returns:
+        Optional[str]: URL аудио или None, если сохранить не удалось
+    """
+    try:
+        return await save_audio_to_s3(audio, filename, content_type=content_type)
+    except Exception as e:
+        print(f"Error archiving answer audio: {e}")
+        return None
+
+
+async def discard_answer_audio(archive_task: "asyncio.Task[Optional[str]]", filename: str):
+    """
+    Удаляет аудио ответа, который не удалось сохранить. Архивация не отменяется
+    (загрузка идет в потоке и все равно завершится) - дожидаемся ее и удаляем объект.
+    """
+    if await asyncio.shield(archive_task) is None:
+        return
+    try:
+        await storage.delete_object(filename)
+    except Exception as e:
+        print(f"Error deleting orphaned answer audio {filename}: {e}")
+
+
+@app.websocket("/exam/answer/stream")
+async def stream_answer(
+    websocket: WebSocket,
+    token: str,
+    exam_session_id: int,
+    question_id: int,
+    content_type: str = "audio/webm",
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Принимает ответ студента потоком аудио-фреймов по WebSocket.
+
+    Протокол: клиент шлет бинарные фреймы аудио, по окончании речи - текстовое
+    сообщение {"type": "stop"}. Сервер шлет {"type": "partial", "transcript": ...}
+    по мере распознавания и {"type": "result", "data": AnswerResponse} после оценки.
+    При ошибке сервер шлет {"type": "error", "detail": ...} и закрывает соединение;
+    ответ длиннее ANSWER_AUDIO_MAX_BYTES или STREAM_ANSWER_MAX_SECONDS закрывается с кодом 1009.
+    """
+    await websocket.accept()
+    turn_timer = StageTimer("exam_turn")
+
+    try:
+        current_user = await get_user_from_token(db, token)
+        exam_session, question = await get_exam_turn(
+            db, current_user, exam_session_id, question_id)
+    except HTTPException as e:
+        await close_websocket_with_error(websocket, e.detail, status.WS_1008_POLICY_VIOLATION)
+        return
+    # Прием аудио может длиться до STREAM_ANSWER_MAX_SECONDS - соединение с БД не держим
+    await end_read_transaction(db)
+
+    async def send_partial(transcript: str, is_final: bool):
+        await websocket.send_json({"type": "partial", "transcript": transcript, "is_final": is_final})
+
+    audio_buffer = bytearray()
+    deadline = time.monotonic() + Settings.STREAM_ANSWER_MAX_SECONDS
+    try:
+        async with transcriber.stream(on_transcript=send_partial) as stream:
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.receive(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    await close_websocket_with_error(
+                        websocket, "Answer is too long", status.WS_1009_MESSAGE_TOO_BIG)
+                    return
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes"):
+                    if len(audio_buffer) + len(message["bytes"]) > Settings.ANSWER_AUDIO_MAX_BYTES:
+                        await close_websocket_with_error(
+                            websocket, "Answer audio is too large", status.WS_1009_MESSAGE_TOO_BIG)
+                        return
+                    audio_buffer.extend(message["bytes"])
+                    await stream.send(message["bytes"])
+                elif message.get("text") and is_stop_message(message["text"]):
+                    break
+
+            # Студент закончил говорить - дожидаемся только хвоста распознавания
+            async with turn_timer.stage("transcription"):
+                transcribed_text = await stream.finish()
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        print(f"Error transcribing streamed answer: {e}")
+        await close_websocket_with_error(
+            websocket, "Speech recognition failed, please retry", status.WS_1011_INTERNAL_ERROR)
+        return
+
+    # Архивируем аудио в S3 параллельно с оценкой ответа
+    extension = content_type.split("/")[-1].split(";")[0] or "webm"
+    answer_filename = f"answers/{uuid.uuid4()}.{extension}"
+    archive_task = asyncio.create_task(archive_answer_audio(bytes(audio_buffer), answer_filename, content_type))
+
+    try:
+        answer_response = await process_exam_answer(
+            db, exam_session, question, transcribed_text, None, turn_timer, audio_archive=archive_task)
+    except LLMUnavailableError:
+        await discard_answer_audio(archive_task, answer_filename)
+        await close_websocket_with_error(
+            websocket, "AI service is temporarily unavailable, please retry", status.WS_1013_TRY_AGAIN_LATER)
+        return
+    except Exception as e:
+        await discard_answer_audio(archive_task, answer_filename)
+        print(f"Error processing streamed answer: {e}")
+        await close_websocket_with_error(websocket, "Failed to process answer", status.WS_1011_INTERNAL_ERROR)
+        return
+
+    turn_timer.finish()
+    try:
+        await websocket.send_json({
+            "type": "result",
+            "data": answer_response.model_dump(mode="json"),
+            "timing": turn_timer.stages
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+
 @app.get("/exam/{exam_session_id}/status", response_model=ExamStatusResponse)
 async def get_exam_status(
     exam_session_id: int = Path(...),
     current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получает статус экзамена
@@ -450,12 +818,11 @@ async def get_exam_status(
     if exam_session.student_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    # Подсчитываем количество вопросов
-    result = await db.execute(
-        select(ExamQuestion).where(
+    # Подсчитываем количество вопросов (COUNT по индексу, без загрузки строк)
+    questions_count = await db.scalar(
+        select(func.count(ExamQuestion.id)).where(
             ExamQuestion.exam_session_id == exam_session_id)
     )
-    questions_count = len(result.scalars().all())
 
     return ExamStatusResponse(
         exam_session_id=exam_session.id,
@@ -478,7 +845,7 @@ async def start_study(
     Запускает сессию подготовки к экзамену
     """
     # Определяем пол преподавателя
-    teacher_gender = await detect_teacher_gender(request.teacher_name)
+    teacher_gender = await detect_teacher_gender(request.teacher_name, db)
 
     # Строим RAG контекст из материалов
     materials_context = await build_rag_context(db, request.subject, request.materials)
@@ -489,11 +856,7 @@ async def start_study(
         teacher_name=request.teacher_name,
         subject=request.subject,
         teacher_description=request.teacher_description,
-        teacher_gender=teacher_gender,
-        context_history=[
-            {"role": "system", "content": f"Преподаватель: {request.teacher_name}, Предмет: {request.subject}"},
-            {"role": "assistant", "content": f"Здравствуй! Я {request.teacher_name}, помогу тебе подготовиться к экзамену по {request.subject}. Задавай вопросы, и я объясню материал."}
-        ]
+        teacher_gender=teacher_gender
     )
     db.add(study_session)
     await db.commit()
@@ -506,6 +869,10 @@ async def start_study(
         is_from_student=False
     )
     db.add(welcome_message)
+    append_turns(db, study_session, [
+        {"role": "system", "content": f"Преподаватель: {request.teacher_name}, Предмет: {request.subject}"},
+        {"role": "assistant", "content": welcome_message.message_text}
+    ])
     await db.commit()
 
     return StudyResponse(
@@ -544,6 +911,8 @@ async def send_study_message(
     db.add(student_message)
     await db.commit()
 
+    history = await load_history(db, study_session)
+
     # Получаем материалы для контекста
     materials_context = await get_subject_materials(db, study_session.subject)
 
@@ -562,8 +931,9 @@ async def send_study_message(
             study_session.teacher_name,
             study_session.subject,
             study_session.teacher_description,
-            study_session.context_history or [],
-            materials_context
+            history,
+            materials_context,
+            history_summary=study_session.history_summary or ""
         )
 
     # Сохраняем ответ преподавателя
@@ -575,11 +945,13 @@ async def send_study_message(
     db.add(teacher_message)
     await db.commit()
 
-    # Обновляем историю контекста
-    study_session.context_history = (study_session.context_history or []) + [
+    # Дописываем ход в журнал диалога
+    turn_history = [
         {"role": "user", "content": f"Студент: {request.message}"},
         {"role": "assistant", "content": teacher_response_text}
     ]
+    append_turns(db, study_session, turn_history)
+    await compact_history(study_session, history + turn_history)
     await db.commit()
 
     return StudyResponse(
@@ -588,15 +960,7 @@ async def send_study_message(
     )
 
 
-@app.get("/study/{study_session_id}/messages", response_model=List[StudyMessageResponse])
-async def get_study_messages(
-    study_session_id: int = Path(...),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
-    """
-    Получает все сообщения из сессии подготовки
-    """
+async def get_owned_study_session(db: AsyncSession, current_user: User, study_session_id: int) -> StudySession:
     study_session = await db.get(StudySession, study_session_id)
     if not study_session:
         raise HTTPException(status_code=404, detail="Study session not found")
@@ -604,25 +968,84 @@ async def get_study_messages(
     if study_session.student_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    result = await db.execute(
-        select(StudyMessage).where(
-            StudyMessage.study_session_id == study_session_id)
-        .order_by(StudyMessage.created_at)
-    )
-    messages = result.scalars().all()
+    return study_session
 
-    return [StudyMessageResponse(
+
+def study_message_response(m: StudyMessage) -> StudyMessageResponse:
+    return StudyMessageResponse(
         study_session_id=m.study_session_id,
         message_id=m.id,
         message_text=m.message_text,
         is_from_student=m.is_from_student,
         created_at=m.created_at
-    ) for m in messages]
+    )
+
+
+@app.get("/study/{study_session_id}/messages", response_model=List[StudyMessageResponse])
+async def get_study_messages(
+    response: Response,
+    study_session_id: int = Path(...),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Получает сообщения из сессии подготовки постранично (keyset по created_at, id).
+    Курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    """
+    await get_owned_study_session(db, current_user, study_session_id)
+
+    query = select(StudyMessage).where(StudyMessage.study_session_id == study_session_id)
+    after = decode_cursor(cursor)
+    if after is not None:
+        query = query.where(tuple_(StudyMessage.created_at, StudyMessage.id) > tuple_(*after))
+
+    result = await db.execute(
+        query.order_by(StudyMessage.created_at, StudyMessage.id).limit(limit + 1)
+    )
+    messages = result.scalars().all()
+
+    if len(messages) > limit:
+        messages = messages[:limit]
+        last = messages[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+
+    return [study_message_response(m) for m in messages]
+
+
+@app.get("/study/{study_session_id}/messages/export")
+async def export_study_messages(
+    request: Request,
+    study_session_id: int = Path(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Выгружает все сообщения сессии подготовки в формате NDJSON. Строки читаются
+    серверным курсором порциями, поэтому память не зависит от длины сессии.
+    """
+    await get_owned_study_session(db, current_user, study_session_id)
+
+    async def rows():
+        # Отдельная сессия: поток читается уже после выхода из обработчика
+        async with read_session_factory(client_key(request))() as stream_db:
+            result = await stream_db.stream_scalars(
+                select(StudyMessage)
+                .where(StudyMessage.study_session_id == study_session_id)
+                .order_by(StudyMessage.created_at, StudyMessage.id)
+                .execution_options(yield_per=Settings.EXPORT_BATCH_SIZE)
+            )
+            async for m in result:
+                yield study_message_response(m).model_dump_json() + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
 # PDF upload endpoints
 @app.post("/materials/upload-pdf", response_model=PDFUploadResponse)
 async def upload_pdf_materials(
+    background_tasks: BackgroundTasks,
     subject: str = Form(...),
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
@@ -668,10 +1091,16 @@ async def upload_pdf_materials(
             }
         )
 
-        # Подсчитываем количество чанков
+        # Чанки в том же порядке, что и в save_pdf_to_qdrant
         from exam.pdf_parser import split_text_into_chunks
-        total_chunks = sum(len(split_text_into_chunks(
-            page, chunk_size=1000, overlap=200)) for page in pdf_pages)
+        chunks = [chunk for page in pdf_pages for chunk in split_text_into_chunks(
+            page, chunk_size=1000, overlap=200)]
+        total_chunks = len(chunks)
+
+        # Банк вопросов строится в фоне, чтобы не задерживать ответ
+        if Settings.QUESTION_BANK_ENABLED:
+            background_tasks.add_task(
+                build_question_bank, subject, chunks, document_ids)
 
         return PDFUploadResponse(
             subject=subject,
@@ -694,6 +1123,7 @@ async def upload_pdf_materials(
 
 @app.post("/materials/upload-pdf-from-url", response_model=PDFUploadResponse)
 async def upload_pdf_from_url(
+    background_tasks: BackgroundTasks,
     subject: str = Form(...),
     pdf_url: str = Form(...),
     current_user: User = Depends(get_current_user),
@@ -732,10 +1162,16 @@ async def upload_pdf_from_url(
             }
         )
 
-        # Подсчитываем количество чанков
+        # Чанки в том же порядке, что и в save_pdf_to_qdrant
         from exam.pdf_parser import split_text_into_chunks
-        total_chunks = sum(len(split_text_into_chunks(
-            page, chunk_size=1000, overlap=200)) for page in pdf_pages)
+        chunks = [chunk for page in pdf_pages for chunk in split_text_into_chunks(
+            page, chunk_size=1000, overlap=200)]
+        total_chunks = len(chunks)
+
+        # Банк вопросов строится в фоне, чтобы не задерживать ответ
+        if Settings.QUESTION_BANK_ENABLED:
+            background_tasks.add_task(
+                build_question_bank, subject, chunks, document_ids)
 
         return PDFUploadResponse(
             subject=subject,
@@ -754,3 +1190,30 @@ async def upload_pdf_from_url(
             status_code=500,
             detail=f"Failed to upload PDF from URL: {str(e)}"
         )
+
+
+@app.post("/materials/upload-pdf/complete", response_model=MaterialUploadCompleteResponse,
+          status_code=status.HTTP_202_ACCEPTED)
+async def complete_pdf_upload(
+    request: MaterialUploadCompleteRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Запускает загрузку в Qdrant PDF, положенного клиентом напрямую в S3 по presigned POST.
+    Разбор, эмбеддинги и банк вопросов выполняются в фоне.
+    """
+    await verify_upload(current_user.id, "material_pdf", request.key)
+
+    background_tasks.add_task(
+        ingest_pdf_from_storage,
+        request.subject,
+        request.key,
+        {"uploaded_by": current_user.id, "uploaded_at": datetime.now().isoformat()}
+    )
+
+    return MaterialUploadCompleteResponse(
+        subject=request.subject,
+        key=request.key,
+        message="PDF ingestion started"
+    )
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, update, or_, text
+from auth.database import AsyncSessionLocal
+from auth.models import RefreshToken, ExamSession
+from main.config import Settings
+from main.metrics import metrics
+
+
+# Ключ advisory lock: обслуживание выполняет только один инстанс за цикл
+MAINTENANCE_LOCK_KEY = 725001
+
+MONITORED_TABLES = ("refresh_tokens", "exam_sessions", "conversation_turns")
+
+
+async def purge_refresh_tokens(batch_size: int) -> int:
+    """
+    Удаляет истекшие и отозванные refresh-токены порциями, чтобы не держать
+    долгих блокировок на таблице, по которой идет каждый /refresh
+
+    Returns:
+        int: Количество удаленных строк
+    """
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            batch = select(RefreshToken.id).where(or_(
+                RefreshToken.is_revoked == True,
+                RefreshToken.expires_at < datetime.now()
+            )).limit(batch_size).scalar_subquery()
+            result = await db.execute(delete(RefreshToken).where(RefreshToken.id.in_(batch)))
+            await db.commit()
+
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        # Даем основной нагрузке пройти между порциями
+        await asyncio.sleep(0)
+
+
+async def close_stale_exam_sessions(max_age: timedelta) -> int:
+    """
+    Помечает брошенные экзамены (in_progress дольше max_age) как abandoned
+
+    Returns:
+        int: Количество закрытых сессий
+    """
+    now = datetime.now()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(ExamSession)
+            .where(ExamSession.status == "in_progress", ExamSession.created_at < now - max_age)
+            .values(status="abandoned", completed_at=now)
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def report_table_sizes():
+    """Экспортирует размер таблиц (вместе с индексами) в метрики"""
+    async with AsyncSessionLocal() as db:
+        for table in MONITORED_TABLES:
+            size = await db.scalar(text("SELECT pg_total_relation_size(CAST(:table AS regclass))"),
+                                   {"table": table})
+            metrics.set_gauge("db_table_bytes", size or 0, table=table)
+
+
+async def run_maintenance() -> dict:
+    """
+    Один цикл обслуживания БД. Пропускается, если его уже выполняет другой инстанс.
+
+    Returns:
+        dict: Количество удаленных/закрытых строк или {"skipped": True}
+    """
+    async with AsyncSessionLocal() as lock_db:
+        locked = await lock_db.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+        if not locked:
+            return {"skipped": True}
+        try:
+            started = time.monotonic()
+            tokens_deleted = await purge_refresh_tokens(Settings.MAINTENANCE_BATCH_SIZE)
+            sessions_closed = await close_stale_exam_sessions(
+                timedelta(hours=Settings.STALE_EXAM_SESSION_HOURS))
+            await report_table_sizes()
+        finally:
+            await lock_db.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MAINTENANCE_LOCK_KEY})
+            await lock_db.commit()
+
+    metrics.inc("maintenance_rows_total", tokens_deleted, kind="refresh_tokens_deleted")
+    metrics.inc("maintenance_rows_total", sessions_closed, kind="exam_sessions_abandoned")
+    metrics.observe("maintenance_seconds", time.monotonic() - started)
+    print(f"🧹 Maintenance: {tokens_deleted} refresh tokens deleted, {sessions_closed} stale exams closed")
+    return {"refresh_tokens_deleted": tokens_deleted, "exam_sessions_abandoned": sessions_closed}
+
+
+async def maintenance_loop():
+    """Периодически запускает обслуживание БД (стартует из lifespan приложения)"""
+    while True:
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.inc("maintenance_errors_total")
+            print(f"Error running maintenance: {e}")
+        await asyncio.sleep(Settings.MAINTENANCE_INTERVAL_SECONDS)
@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels_key(labels: Dict[str, object]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_name(name: str, labels_key: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels_key:
+        return name
+    labels_text = ",".join(f'{k}="{v}"' for k, v in labels_key)
+    return f"{name}{{{labels_text}}}"
+
+
+class MetricsRegistry:
+    """Простой потокобезопасный реестр метрик (счетчики, gauge, гистограммы)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        self._histograms: Dict[Tuple, Dict] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Увеличивает счетчик"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Устанавливает значение gauge"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, buckets: Optional[Iterable[float]] = None, **labels):
+        """Добавляет наблюдение в гистограмму"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {
+                    "buckets": {b: 0 for b in (buckets or DEFAULT_BUCKETS)},
+                    "count": 0,
+                    "sum": 0.0
+                }
+                self._histograms[key] = histogram
+            for bound in histogram["buckets"]:
+                if value <= bound:
+                    histogram["buckets"][bound] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def get_counter(self, name: str, **labels) -> float:
+        """Возвращает текущее значение счетчика"""
+        with self._lock:
+            return self._counters.get((name, _labels_key(labels)), 0.0)
+
+    def snapshot(self) -> Dict:
+        """Возвращает снимок всех метрик в виде словаря"""
+        with self._lock:
+            return {
+                "counters": {_format_name(n, l): v for (n, l), v in self._counters.items()},
+                "gauges": {_format_name(n, l): v for (n, l), v in self._gauges.items()},
+                "histograms": {
+                    _format_name(n, l): {
+                        "count": h["count"],
+                        "sum": h["sum"],
+                        "buckets": {str(b): c for b, c in h["buckets"].items()}
+                    }
+                    for (n, l), h in self._histograms.items()
+                }
+            }
+
+    def render_prometheus(self) -> str:
+        """Возвращает метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{_format_name(name, labels)} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                lines.append(f"{_format_name(name, labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items(), key=lambda item: item[0]):
+                for bound, count in h["buckets"].items():
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(f"{_format_name(name + '_bucket', bucket_labels)} {count}")
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(f"{_format_name(name + '_bucket', inf_labels)} {h['count']}")
+                lines.append(f"{_format_name(name + '_count', labels)} {h['count']}")
+                lines.append(f"{_format_name(name + '_sum', labels)} {h['sum']}")
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
+
+
+class StageTimer:
+    """Замер длительности этапов одного запроса (например, хода экзамена)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages: Dict[str, float] = {}
+        self.started = time.monotonic()
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+            metrics.observe(f"{self.name}_stage_seconds", elapsed, stage=stage)
+
+    def finish(self) -> float:
+        """Фиксирует общую длительность запроса"""
+        total = time.monotonic() - self.started
+        self.stages["total"] = total
+        metrics.observe(f"{self.name}_seconds", total)
+        return total
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in self.stages.items())
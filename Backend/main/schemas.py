@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class UserBase(BaseModel):
@@ -164,3 +164,34 @@ class PDFUploadResponse(BaseModel):
     pages_count: int
     chunks_count: int
     message: str
+
+
+# Presigned upload schemas
+class UploadPresignRequest(BaseModel):
+    purpose: str
+    content_type: str
+    size: int
+
+
+class UploadPresignResponse(BaseModel):
+    key: str
+    url: str
+    fields: Dict[str, str]
+    expires_in: int
+
+
+class AnswerUploadCompleteRequest(BaseModel):
+    exam_session_id: int
+    question_id: int
+    key: str
+
+
+class MaterialUploadCompleteRequest(BaseModel):
+    subject: str
+    key: str
+
+
+class MaterialUploadCompleteResponse(BaseModel):
+    subject: str
+    key: str
+    message: str
@@ -0,0 +1,199 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, Union
+from botocore.exceptions import ClientError, EndpointConnectionError, ConnectionClosedError, ReadTimeoutError
+from main.config import Settings
+from main.metrics import metrics
+
+
+# Минимальный размер части multipart-загрузки в S3 (кроме последней) - 5 МБ
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+TRANSIENT_ERRORS = (EndpointConnectionError, ConnectionClosedError, ReadTimeoutError)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, ClientError):
+        status_code = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return status_code == 429 or status_code >= 500
+    return False
+
+
+class S3Storage:
+    """
+    Асинхронная обертка над пуловым клиентом boto3: вызовы выполняются в пуле
+    потоков, не блокируя event loop, с повторами и экспоненциальной задержкой
+    """
+
+    def __init__(self, client, bucket: str, endpoint: str, max_retries: int, retry_base_delay: float, part_size: int):
+        self.client = client
+        self.bucket = bucket
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.part_size = max(part_size, MIN_PART_SIZE)
+
+    def url(self, key: str) -> str:
+        """Публичный URL объекта"""
+        return f"{self.endpoint}/{self.bucket}/{key}"
+
+    async def _call(self, operation: str, **kwargs):
+        method = getattr(self.client, operation)
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                result = await asyncio.to_thread(method, Bucket=self.bucket, **kwargs)
+                metrics.observe("s3_request_seconds", time.monotonic() - started, operation=operation)
+                return result
+            except Exception as e:
+                if not _is_transient(e) or attempt >= self.max_retries:
+                    metrics.inc("s3_errors_total", operation=operation)
+                    raise
+                print(f"S3 {operation} failed, retrying: {e}")
+            metrics.inc("s3_retries_total", operation=operation)
+            await asyncio.sleep(random.uniform(0, self.retry_base_delay * (2 ** attempt)))
+
+    async def put_object(self, key: str, body: Union[bytes, bytearray], content_type: Optional[str] = None) -> str:
+        """
+        Загружает объект целиком (для небольших данных, уже находящихся в памяти)
+
+        Returns:
+            str: URL объекта
+        """
+        kwargs = {"Key": key, "Body": body}
+        if content_type:
+            kwargs["ContentType"] = content_type
+        await self._call("put_object", **kwargs)
+        metrics.inc("s3_uploaded_bytes_total", len(body))
+        return self.url(key)
+
+    async def delete_object(self, key: str):
+        """Удаляет объект (отсутствие объекта не считается ошибкой)"""
+        await self._call("delete_object", Key=key)
+
+    async def object_exists(self, key: str) -> bool:
+        return await self.head_object(key) is not None
+
+    async def head_object(self, key: str) -> Optional[dict]:
+        """Метаданные объекта или None, если объекта нет"""
+        try:
+            return await self._call("head_object", Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def get_object_bytes(self, key: str) -> bytes:
+        """Скачивает объект целиком"""
+        response = await self._call("get_object", Key=key)
+        return await asyncio.to_thread(response["Body"].read)
+
+    def presigned_post(self, key: str, content_type: str, max_size: int, expires_in: int) -> dict:
+        """
+        Политика presigned POST для загрузки клиентом напрямую в S3: S3 сам
+        проверяет Content-Type и размер файла
+
+        Returns:
+            dict: {"url": str, "fields": dict}
+        """
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, max_size]
+            ],
+            ExpiresIn=expires_in
+        )
+
+    def presigned_get(self, key: str, expires_in: int) -> str:
+        """Временная ссылка на чтение объекта (например, для Deepgram)"""
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in
+        )
+
+    async def upload_stream(
+        self,
+        key: str,
+        read: Callable[[int], Awaitable[bytes]],
+        content_type: Optional[str] = None
+    ) -> str:
+        """
+        Загружает данные частями multipart-загрузкой: в памяти держится не больше
+        одной части, поэтому потребление памяти не зависит от размера файла.
+        Для UploadFile это поток из временного файла, в который Starlette уже
+        сохранил тело запроса (в памяти до 1 МБ, дальше на диске).
+
+        Args:
+            key: Ключ объекта
+            read: Асинхронная функция чтения (например, UploadFile.read)
+            content_type: MIME-тип
+
+        Returns:
+            str: URL объекта
+        """
+        first_part = await self._read_part(read)
+        if len(first_part) < self.part_size:
+            # Файл поместился в одну часть - multipart не нужен
+            return await self.put_object(key, first_part, content_type)
+
+        create_kwargs = {"Key": key}
+        if content_type:
+            create_kwargs["ContentType"] = content_type
+        upload = await self._call("create_multipart_upload", **create_kwargs)
+        upload_id = upload["UploadId"]
+
+        parts = []
+        try:
+            part = first_part
+            while part:
+                part_number = len(parts) + 1
+                result = await self._call(
+                    "upload_part", Key=key, UploadId=upload_id, PartNumber=part_number, Body=part)
+                parts.append({"ETag": result["ETag"], "PartNumber": part_number})
+                metrics.inc("s3_uploaded_bytes_total", len(part))
+                part = await self._read_part(read)
+
+            await self._call(
+                "complete_multipart_upload",
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            try:
+                await self._call("abort_multipart_upload", Key=key, UploadId=upload_id)
+            except Exception as e:
+                print(f"Error aborting multipart upload {upload_id}: {e}")
+            raise
+
+        return self.url(key)
+
+    async def _read_part(self, read: Callable[[int], Awaitable[bytes]]) -> bytearray:
+        # read(n) может вернуть меньше n байт - дочитываем до размера части.
+        # Буфер отдается в boto3 как есть, без копирования в bytes (memoryview
+        # boto3 не принимает: Body должен быть bytes, bytearray или файлом)
+        buffer = bytearray()
+        while len(buffer) < self.part_size:
+            chunk = await read(self.part_size - len(buffer))
+            if not chunk:
+                break
+            buffer += chunk
+        return buffer
+
+
+# Глобальное хранилище
+storage = S3Storage(
+    client=Settings.S3_CLIENT,
+    bucket=Settings.S3_BUCKET,
+    endpoint=Settings.S3_ENDPOINT,
+    max_retries=Settings.S3_MAX_RETRIES,
+    retry_base_delay=Settings.S3_RETRY_BASE_DELAY,
+    part_size=Settings.S3_MULTIPART_PART_SIZE
+)
@@ -0,0 +1,94 @@
+import mimetypes
+import uuid
+from fastapi import HTTPException, status
+from main.config import Settings
+from main.storage import storage
+
+
+# Что разрешено загружать напрямую в S3: префикс ключа, MIME-типы и лимит размера
+UPLOAD_POLICIES = {
+    "answer_audio": {
+        "prefix": "answers",
+        "content_types": ("audio/webm", "audio/ogg", "audio/mpeg", "audio/mp4", "audio/wav", "audio/x-wav"),
+        "max_size": Settings.ANSWER_AUDIO_MAX_BYTES
+    },
+    "material_pdf": {
+        "prefix": "materials",
+        "content_types": ("application/pdf",),
+        "max_size": Settings.MATERIAL_PDF_MAX_BYTES
+    }
+}
+
+
+def _key_prefix(user_id: int, purpose: str) -> str:
+    return f"uploads/{user_id}/{UPLOAD_POLICIES[purpose]['prefix']}/"
+
+
+def create_presigned_upload(user_id: int, purpose: str, content_type: str, size: int) -> dict:
+    """
+    Выдает presigned POST для загрузки файла клиентом напрямую в S3
+
+    Args:
+        user_id: ID пользователя (ключ привязывается к нему)
+        purpose: Назначение загрузки (answer_audio, material_pdf)
+        content_type: MIME-тип файла
+        size: Размер файла в байтах
+
+    Returns:
+        dict: {"key", "url", "fields", "expires_in"}
+    """
+    policy = UPLOAD_POLICIES.get(purpose)
+    if policy is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown upload purpose: {purpose}"
+        )
+    if content_type not in policy["content_types"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content type {content_type} is not allowed for {purpose}"
+        )
+    if size <= 0 or size > policy["max_size"]:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size must be between 1 and {policy['max_size']} bytes"
+        )
+
+    extension = mimetypes.guess_extension(content_type) or ""
+    key = f"{_key_prefix(user_id, purpose)}{uuid.uuid4()}{extension}"
+    presigned = storage.presigned_post(
+        key, content_type, policy["max_size"], Settings.PRESIGNED_UPLOAD_EXPIRES)
+
+    return {
+        "key": key,
+        "url": presigned["url"],
+        "fields": presigned["fields"],
+        "expires_in": Settings.PRESIGNED_UPLOAD_EXPIRES
+    }
+
+
+async def verify_upload(user_id: int, purpose: str, key: str) -> dict:
+    """
+    Проверяет, что загрузка принадлежит пользователю и объект действительно лежит в S3
+
+    Returns:
+        dict: Метаданные объекта (head_object)
+    """
+    if not key.startswith(_key_prefix(user_id, purpose)) or ".." in key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Upload key does not belong to current user"
+        )
+
+    head = await storage.head_object(key)
+    if head is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Uploaded file not found"
+        )
+    if head.get("ContentLength", 0) > UPLOAD_POLICIES[purpose]["max_size"]:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Uploaded file is too large"
+        )
+    return head
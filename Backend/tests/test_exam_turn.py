@@ -0,0 +1,199 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("fastapi")
+
+from sqlalchemy import event, select
+from conftest import requires_db, run
+
+# Ход экзамена: чтение истории, материалов и банка вопросов, затем запись
+# ответа, реплик, следующего вопроса, сессии, счетчика банка и commit
+MAX_TURN_STATEMENTS = 12
+
+
+def _turn_statements() -> float:
+    from main.metrics import metrics
+
+    histogram = metrics.snapshot()["histograms"].get("exam_turn_db_statements")
+    return histogram["sum"] if histogram else 0.0
+
+
+async def _create_exam(db):
+    from auth.models import User, ExamSession, ExamQuestion, QuestionBankItem
+
+    user = User(email="student@example.com", username="student", hashed_password="x")
+    db.add(user)
+    await db.flush()
+    exam_session = ExamSession(
+        student_id=user.id,
+        teacher_name="Иван Петрович",
+        subject="Физика",
+        teacher_description="Строгий"
+    )
+    db.add(exam_session)
+    await db.flush()
+    question = ExamQuestion(exam_session_id=exam_session.id, question_index=0,
+                            question_text="Что такое сила?", is_follow_up=False)
+    db.add(question)
+    db.add_all([
+        QuestionBankItem(subject="Физика", question_text=f"Вопрос {i}", difficulty="medium")
+        for i in range(3)
+    ])
+    await db.commit()
+    return exam_session.id, question.id
+
+
+def _patch_external_calls(monkeypatch, db, outside_transaction):
+    from main import endpoints
+
+    def external(name, result):
+        async def call(*args, **kwargs):
+            outside_transaction.append((name, not db.in_transaction()))
+            return result
+        monkeypatch.setattr(endpoints, name, call)
+
+    external("check_if_off_topic", {"is_off_topic": False})
+    external("analyze_answer", {
+        "is_correct": True,
+        "feedback": "Верно",
+        "teacher_mood": "happy",
+        "should_ask_followup": False,
+        "exam_completed": False
+    })
+    external("text_to_speech_url", "https://example.com/question.ogg")
+
+    async def get_subject_materials(db, subject, query=None):
+        from auth.models import SubjectMaterials
+        await db.execute(select(SubjectMaterials.content).where(SubjectMaterials.subject == subject))
+        return "материалы"
+    monkeypatch.setattr(endpoints, "get_subject_materials", get_subject_materials)
+
+
+@requires_db
+def test_exam_turn_db_round_trips(db_schema, monkeypatch):
+    from auth.database import AsyncSessionLocal
+    from auth.models import ExamSession, ExamQuestion, QuestionBankItem
+    from main import endpoints
+    from main.metrics import StageTimer
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            exam_session_id, question_id = await _create_exam(db)
+
+        turns = []
+        for _ in range(2):
+            async with AsyncSessionLocal() as db:
+                outside_transaction = []
+                _patch_external_calls(monkeypatch, db, outside_transaction)
+                flushes = []
+                event.listen(db.sync_session, "after_flush", lambda *_: flushes.append(1))
+
+                exam_session = await db.get(ExamSession, exam_session_id)
+                question = await db.get(ExamQuestion, question_id)
+                await db.commit()
+
+                before = _turn_statements()
+                response = await endpoints.process_exam_answer(
+                    db, exam_session, question, "Сила - мера взаимодействия тел",
+                    "https://example.com/answer.ogg", StageTimer("exam_turn"))
+                turns.append((_turn_statements() - before, len(flushes), outside_transaction))
+                question_id = response.next_question.question_id
+
+        async with AsyncSessionLocal() as db:
+            used = (await db.execute(select(QuestionBankItem.times_used))).scalars().all()
+            exam_session = await db.get(ExamSession, exam_session_id)
+        return turns, used, exam_session
+
+    turns, used, exam_session = run(scenario())
+
+    for statements, flushes, outside_transaction in turns:
+        assert statements <= MAX_TURN_STATEMENTS
+        # Все изменения хода записываются одним flush внутри единственного commit
+        assert flushes == 1
+        # Ни один внешний вызов не выполняется внутри открытой транзакции
+        assert outside_transaction and all(ok for _, ok in outside_transaction)
+    # Число запросов не зависит от длины истории
+    assert turns[0][0] == turns[1][0]
+    assert sorted(used) == [0, 1, 1]
+    assert exam_session.teacher_mood == "happy"
+    assert exam_session.current_question_index == 2
+
+
+def _answer_handlers():
+    from io import BytesIO
+    from fastapi import UploadFile
+    from starlette.datastructures import Headers
+    from main import endpoints
+    from main.schemas import AnswerRequest, AnswerUploadCompleteRequest
+
+    def submit_answer(db, user, exam_session_id, question_id):
+        return endpoints.submit_answer(
+            AnswerRequest(exam_session_id=exam_session_id, question_id=question_id,
+                          answer_audio_url="https://example.com/answer.ogg"),
+            endpoints.Response(), current_user=user, db=db)
+
+    def submit_answer_upload(db, user, exam_session_id, question_id):
+        audio = UploadFile(BytesIO(b"audio"), size=5, filename="answer.webm",
+                           headers=Headers({"content-type": "audio/webm"}))
+        return endpoints.submit_answer_upload(
+            endpoints.Response(), exam_session_id=exam_session_id, question_id=question_id,
+            audio=audio, current_user=user, db=db)
+
+    def complete_answer_upload(db, user, exam_session_id, question_id):
+        return endpoints.complete_answer_upload(
+            AnswerUploadCompleteRequest(exam_session_id=exam_session_id, question_id=question_id,
+                                        key=f"uploads/{user.id}/answers/answer.webm"),
+            endpoints.Response(), current_user=user, db=db)
+
+    return [submit_answer, submit_answer_upload, complete_answer_upload]
+
+
+@requires_db
+def test_answer_endpoints_transcribe_outside_transaction(db_schema, monkeypatch):
+    from auth.database import AsyncSessionLocal
+    from auth.models import ExamSession, User
+    from main import endpoints
+
+    transcriptions = []
+
+    async def process_exam_answer(db, *args, **kwargs):
+        # Оценка ответа проверяется отдельно (test_exam_turn_db_round_trips)
+        return "graded"
+
+    async def archive_answer_audio(*args, **kwargs):
+        return "https://example.com/answer.webm"
+
+    async def verify_upload(*args, **kwargs):
+        return {}
+
+    monkeypatch.setattr(endpoints, "process_exam_answer", process_exam_answer)
+    monkeypatch.setattr(endpoints, "archive_answer_audio", archive_answer_audio)
+    monkeypatch.setattr(endpoints, "verify_upload", verify_upload)
+    monkeypatch.setattr(endpoints.storage, "presigned_get", lambda key, expires_in: f"https://example.com/{key}")
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            exam_session_id, question_id = await _create_exam(db)
+
+        for handler in _answer_handlers():
+            async with AsyncSessionLocal() as db:
+                async def transcribe(*args, **kwargs):
+                    transcriptions.append((handler.__name__, not db.in_transaction()))
+                    return "Сила - мера взаимодействия тел"
+                monkeypatch.setattr(endpoints, "transcribe_audio", transcribe)
+                monkeypatch.setattr(endpoints, "transcribe_audio_bytes", transcribe)
+
+                exam_session = await db.get(ExamSession, exam_session_id)
+                user = await db.get(User, exam_session.student_id)
+                await db.commit()
+
+                assert await handler(db, user, exam_session_id, question_id) == "graded"
+
+    run(scenario())
+
+    assert transcriptions == [
+        ("submit_answer", True),
+        ("submit_answer_upload", True),
+        ("complete_answer_upload", True),
+    ]
@@ -0,0 +1,42 @@
+import struct
+
+from exam.ogg import OggPage, FLAG_BOS, FLAG_EOS, concat_opus, parse_pages
+
+# Синтез отдает 20 мс кадры (960 сэмплов при 48 кГц) и стандартный pre-skip
+FRAME_SAMPLES = 960
+PRE_SKIP = 312
+
+
+def _opus_stream(serial: int, frames: int, pre_skip: int = PRE_SKIP) -> bytes:
+    opus_head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, pre_skip, 48000, 0, 0)
+    opus_tags = b"OpusTags" + struct.pack("<I", 4) + b"fake" + struct.pack("<I", 0)
+    frame = b"\xf8\xff\xfe"
+    pages = [
+        OggPage(FLAG_BOS, 0, serial, 0, bytes([len(opus_head)]), opus_head),
+        OggPage(0, 0, serial, 1, bytes([len(opus_tags)]), opus_tags),
+    ]
+    for i in range(frames):
+        flags = FLAG_EOS if i == frames - 1 else 0
+        pages.append(OggPage(flags, (i + 1) * FRAME_SAMPLES, serial, i + 2, bytes([len(frame)]), frame))
+    return b"".join(page.to_bytes() for page in pages)
+
+
+def test_concat_opus_rebases_granules_without_later_pre_skip():
+    pages = parse_pages(concat_opus([_opus_stream(1, 2), _opus_stream(2, 2), _opus_stream(3, 1)]))
+
+    # Заголовки только от первого потока, дальше - аудио всех частей подряд
+    assert [page.sequence for page in pages] == list(range(7))
+    assert {page.serial for page in pages} == {1}
+    assert [page.flags for page in pages] == [FLAG_BOS, 0, 0, 0, 0, 0, FLAG_EOS]
+    # Pre-skip первого потока учитывает декодер, разгон остальных вычитается
+    assert [page.granule for page in pages] == [
+        0, 0,
+        960, 1920,
+        1920 + 960 - PRE_SKIP, 1920 + 1920 - PRE_SKIP,
+        3840 - PRE_SKIP + 960 - PRE_SKIP,
+    ]
+
+
+def test_concat_opus_single_stream_is_unchanged():
+    stream = _opus_stream(1, 3)
+    assert concat_opus([stream]) == stream
@@ -0,0 +1,91 @@
+"""
+Регрессия планов запросов: горячие чтения должны идти по составным индексам
+(миграция a7c4e2b9d831), а не полным сканированием таблицы.
+"""
+import json
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("asyncpg")
+pytest.importorskip("fastapi")
+
+from sqlalchemy import insert, text
+from conftest import requires_db, run
+
+SESSIONS = 200
+ROWS_PER_SESSION = 50
+
+
+def _index_names(plan) -> set:
+    names = set()
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            names.add(plan["Index Name"])
+        for value in plan.values():
+            names |= _index_names(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            names |= _index_names(item)
+    return names
+
+
+async def _explain(conn, sql: str, params: dict) -> set:
+    plan = await conn.scalar(text(f"EXPLAIN (FORMAT JSON) {sql}"), params)
+    return _index_names(json.loads(plan) if isinstance(plan, str) else plan)
+
+
+async def _seed(conn):
+    from auth.models import User, ExamSession, ExamQuestion, StudySession, StudyMessage
+
+    now = datetime.now()
+    session_fields = {"student_id": 1, "teacher_name": "Иван Петрович", "subject": "Физика",
+                      "teacher_description": "-", "created_at": now}
+    await conn.execute(insert(User).values(id=1, email="plan@example.com", username="plan", hashed_password="x"))
+    await conn.execute(insert(ExamSession), [{"id": s, **session_fields} for s in range(1, SESSIONS + 1)])
+    await conn.execute(insert(StudySession), [{"id": s, **session_fields} for s in range(1, SESSIONS + 1)])
+    await conn.execute(insert(ExamQuestion), [
+        {"exam_session_id": s, "question_index": q, "question_text": "Вопрос"}
+        for s in range(1, SESSIONS + 1) for q in range(ROWS_PER_SESSION)
+    ])
+    await conn.execute(insert(StudyMessage), [
+        {"study_session_id": s, "message_text": "Сообщение", "is_from_student": True,
+         "created_at": now + timedelta(seconds=m)}
+        for s in range(1, SESSIONS + 1) for m in range(ROWS_PER_SESSION)
+    ])
+    await conn.execute(text("ANALYZE"))
+
+
+@requires_db
+def test_hot_reads_use_composite_indexes(db_schema):
+    from auth.database import engine
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await _seed(conn)
+
+        async with engine.connect() as conn:
+            # GET /exam/{id}/status
+            status_count = await _explain(
+                conn,
+                "SELECT count(exam_questions.id) FROM exam_questions "
+                "WHERE exam_questions.exam_session_id = :exam_session_id",
+                {"exam_session_id": SESSIONS // 2})
+
+            # GET /study/{id}/messages: страница после курсора
+            keyset_page = await _explain(
+                conn,
+                "SELECT * FROM study_messages "
+                "WHERE study_messages.study_session_id = :study_session_id "
+                "AND (study_messages.created_at, study_messages.id) > (CAST(:after_created_at AS timestamp), :after_id) "
+                "ORDER BY study_messages.created_at, study_messages.id LIMIT :limit",
+                {"study_session_id": SESSIONS // 2,
+                 "after_created_at": datetime.now() + timedelta(seconds=ROWS_PER_SESSION // 2),
+                 "after_id": 0, "limit": 101})
+
+        return status_count, keyset_page
+
+    status_count, keyset_page = run(scenario())
+
+    assert "ix_exam_questions_exam_session_id_question_index" in status_count
+    assert "ix_study_messages_study_session_id_created_at" in keyset_page
@@ -67,6 +67,16 @@ export interface StudyMessageResponse {
     created_at: string;
 }
 
+export interface StudyMessagesRequest {
+    studySessionId: number;
+    cursor: string | null;
+}
+
+export interface StudyMessagesPage {
+    messages: StudyMessageResponse[];
+    nextCursor: string | null;
+}
+
 export interface PDFUploadResponse {
     subject: string;
     document_ids: string[];
@@ -75,6 +85,9 @@ export interface PDFUploadResponse {
     message: string;
 }
 
+// Размер страницы GET /study/{id}/messages, следующие подгружаются по запросу
+const STUDY_MESSAGES_PAGE_SIZE = 50;
+
 export const examApi = createApi ({
     reducerPath: 'examApi',
     baseQuery: baseQueryWithReauth,
@@ -134,8 +147,24 @@ export const examApi = createApi ({
             }),
         }),
 
-        getStudyMessages: builder.query<StudyMessageResponse[], number>({
-            query: (studySessionId) => `/study/${studySessionId}/messages`,
+        getStudyMessages: builder.query<StudyMessagesPage, StudyMessagesRequest>({
+            query: ({ studySessionId, cursor }) => ({
+                url: `/study/${studySessionId}/messages`,
+                params: cursor ? { limit: STUDY_MESSAGES_PAGE_SIZE, cursor } : { limit: STUDY_MESSAGES_PAGE_SIZE },
+            }),
+            transformResponse: (messages: StudyMessageResponse[], meta) => ({
+                messages,
+                nextCursor: meta?.response?.headers.get("X-Next-Cursor") ?? null,
+            }),
+            // Одна запись кэша на сессию: страницы по курсору дописываются в нее,
+            // а опрос текущей страницы добавляет только новые сообщения
+            serializeQueryArgs: ({ endpointName, queryArgs }) => `${endpointName}(${queryArgs.studySessionId})`,
+            merge: (currentCache, page) => {
+                const known = new Set(currentCache.messages.map(msg => msg.message_id));
+                currentCache.messages.push(...page.messages.filter(msg => !known.has(msg.message_id)));
+                currentCache.nextCursor = page.nextCursor;
+            },
+            forceRefetch: ({ currentArg, previousArg }) => currentArg?.cursor !== previousArg?.cursor,
             providesTags: ['Study'],
         }),
 
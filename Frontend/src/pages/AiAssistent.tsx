@@ -38,6 +38,7 @@ export default function AIAssistant() {
 
     const [studySessionId, setStudySessionId] = useState<number | null>(null);
     const [studyMessages, setStudyMessages] = useState<StudyMessage[]>([]);
+    const [studyMessagesCursor, setStudyMessagesCursor] = useState<string | null>(null);
     const [studyInput, setStudyInput] = useState('');
 
     const [teacherName, setTeacherName] = useState('');
@@ -57,12 +58,12 @@ export default function AIAssistant() {
     const [startStudy, { isLoading: isStartingStudy }] = useStartStudyMutation();
     const [sendStudyMessage, { isLoading: isSendingMessage }] = useSendStudyMessageMutation();
 
-    const { data: studyMessagesData } = useGetStudyMessagesQuery(studySessionId!, { skip: !studySessionId, pollingInterval: studySessionId ? 2000 : 0 });
+    const { data: studyMessagesData, isFetching: isFetchingStudyMessages } = useGetStudyMessagesQuery({ studySessionId: studySessionId!, cursor: studyMessagesCursor }, { skip: !studySessionId, pollingInterval: studySessionId ? 2000 : 0 });
     const { data: examStatus } = useGetExamStatusQuery(examSessionId!, { skip: !examSessionId, pollingInterval: examSessionId ? 3000 : 0 });
 
     useEffect(() => {
         if (studyMessagesData) {
-            const formatted: StudyMessage[] = studyMessagesData.map(msg => ({
+            const formatted: StudyMessage[] = studyMessagesData.messages.map(msg => ({
                 id: msg.message_id.toString(),
                 text: msg.message_text,
                 isFromStudent: msg.is_from_student,
@@ -177,6 +178,7 @@ export default function AIAssistant() {
         try {
             const result = await startStudy({ teacher_name: teacherName, subject, teacher_description: teacherDescription, materials: materials.filter(m => m.trim() !== '') }).unwrap();
             setStudySessionId(result.study_session_id);
+            setStudyMessagesCursor(null);
             setStudyStarted(true);
             setMode('study');
             const welcomeMsg: StudyMessage = { id: 'welcome', text: result.teacher_response, isFromStudent: false, timestamp: new Date() };
@@ -401,7 +403,7 @@ export default function AIAssistant() {
                             <h1 className="text-3xl font-bold text-white">Подготовка к экзамену</h1>
                             <p className="text-gray-400">{subject} - {teacherName}</p>
                         </div>
-                        <button onClick={() => { setMode('select'); setStudyStarted(false); setStudySessionId(null); }} className="p-2 hover:bg-white/10 rounded-full transition">
+                        <button onClick={() => { setMode('select'); setStudyStarted(false); setStudySessionId(null); setStudyMessagesCursor(null); }} className="p-2 hover:bg-white/10 rounded-full transition">
                             <X className="w-5 h-5 text-gray-400" />
                         </button>
                     </div>
@@ -421,6 +423,13 @@ export default function AIAssistant() {
                                 </div>
                             </div>
                         ))}
+                        {studyMessagesData?.nextCursor && (
+                            <div className="flex justify-center">
+                                <button onClick={() => setStudyMessagesCursor(studyMessagesData.nextCursor)} disabled={isFetchingStudyMessages} className="px-4 py-2 text-sm text-cyan-300 bg-white/5 border border-cyan-500/30 rounded-full hover:bg-white/10 transition disabled:opacity-50">
+                                    {isFetchingStudyMessages ? 'Загрузка...' : 'Показать еще'}
+                                </button>
+                            </div>
+                        )}
                         <div ref={messagesEndRef} />
                         {isSendingMessage && (
                             <div className="flex justify-start">